@@ -0,0 +1,86 @@
+"""
+Change Versions for Sam
+=======================
+Per-session, per-collection version counters, kept on the session registry
+document as `versions.<collection>` and bumped by every write path. Polled
+read endpoints turn the version into an ETag and answer If-None-Match with
+304 Not Modified — one _id lookup instead of a query, a sort and a
+serialization when nothing has changed, which is most polls.
+
+Versions live in Mongo rather than in-process so every worker hands out the
+same ETag for the same data.
+"""
+
+import logging
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeVersions:
+    """versions.<collection> counters on the session registry"""
+
+    def __init__(self, db):
+        self.db = db
+        self.checks = 0
+        self.not_modified = 0
+        self.bumps = 0
+
+    @staticmethod
+    def inc(collection: str, n: int = 1) -> dict:
+        """$inc fragment, for writes that already update the registry document"""
+        return {f"versions.{collection}": n}
+
+    async def get(self, session_id: str, collection: str) -> int:
+        doc = await self.db.sessions.find_one({"_id": session_id}, {f"versions.{collection}": 1})
+        return ((doc or {}).get("versions") or {}).get(collection, 0)
+
+    async def bump(self, session_id: str, collection: str) -> int:
+        doc = await self.db.sessions.find_one_and_update(
+            {"_id": session_id},
+            {"$inc": self.inc(collection), "$setOnInsert": {"session_id": session_id}},
+            projection={f"versions.{collection}": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self.bumps += 1
+        return doc["versions"][collection]
+
+    @staticmethod
+    def etag(collection: str, version: int, *variant) -> str:
+        """Weak ETag; `variant` carries query parameters that change the body (limit etc.)"""
+        suffix = "".join(f"-{v}" for v in variant)
+        return f'W/"{collection}-{version}{suffix}"'
+
+    def matches(self, if_none_match: Optional[str], etag: str) -> bool:
+        self.checks += 1
+        if not if_none_match:
+            return False
+        tags = {t.strip() for t in if_none_match.split(",")}
+        # Weak comparison: W/"x" and "x" name the same representation
+        if "*" in tags or etag in tags or etag[2:] in tags:
+            self.not_modified += 1
+            return True
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "conditional_requests": self.checks,
+            "not_modified": self.not_modified,
+            "hit_ratio": round(self.not_modified / self.checks, 3) if self.checks else 0.0,
+            "bumps": self.bumps,
+        }
+
+
+# Singleton instance
+_versions: Optional[ChangeVersions] = None
+
+
+def get_change_versions(db) -> ChangeVersions:
+    """Get or create the change versions singleton"""
+    global _versions
+    if _versions is None:
+        _versions = ChangeVersions(db)
+    return _versions
@@ -0,0 +1,176 @@
+"""
+Session Context Cache for Sam
+=============================
+In-process cache of what build_messages needs for a session: a ring buffer of
+the most recent turns, the most recent memories and the latest weekly
+reflection. Writers update it as they persist, so most turns never touch
+MongoDB for context. Entries expire after a TTL so writes made by other
+workers are picked up.
+"""
+
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+CONTEXT_CACHE_TURNS = int(os.environ.get("CONTEXT_CACHE_TURNS", "40"))
+CONTEXT_CACHE_MEMORIES = int(os.environ.get("CONTEXT_CACHE_MEMORIES", "16"))
+CONTEXT_CACHE_SESSIONS = int(os.environ.get("CONTEXT_CACHE_SESSIONS", "1000"))
+CONTEXT_CACHE_TTL = float(os.environ.get("CONTEXT_CACHE_TTL", "60"))
+
+MISSING = object()
+
+
+class _Window:
+    """Tail of an ordered collection. `complete` means it holds every item there is."""
+
+    def __init__(self, maxlen: int):
+        self.items: deque = deque(maxlen=maxlen)
+        self.complete = False
+        self.loaded_at = 0.0
+        self.version = 0  # bumped on every write so a racing load can tell it is stale
+
+    def load(self, items: list, complete: bool, version: int):
+        if version != self.version:
+            return
+        self.items.clear()
+        self.items.extend(items)
+        self.complete = complete
+        self.loaded_at = time.monotonic()
+
+    def push(self, item: dict, newest_first: bool = False):
+        self.version += 1
+        if not self.fresh():
+            return
+        if len(self.items) == self.items.maxlen:
+            self.complete = False
+        if newest_first:
+            self.items.appendleft(item)
+        else:
+            self.items.append(item)
+
+    def fresh(self) -> bool:
+        return bool(self.loaded_at) and time.monotonic() - self.loaded_at < CONTEXT_CACHE_TTL
+
+    def covers(self, limit: int) -> bool:
+        return self.fresh() and (limit <= len(self.items) or self.complete)
+
+
+class _SessionEntry:
+    def __init__(self):
+        self.turns = _Window(CONTEXT_CACHE_TURNS)        # oldest → newest
+        self.memories = _Window(CONTEXT_CACHE_MEMORIES)  # newest → oldest
+        self.weekly = MISSING
+        self.weekly_loaded_at = 0.0
+
+
+class SessionContextCache:
+    """LRU of per-session context windows"""
+
+    def __init__(self, max_sessions: int = CONTEXT_CACHE_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, session_id: str) -> _SessionEntry:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            entry = self._sessions[session_id] = _SessionEntry()
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return entry
+
+    def _count(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    # ── turns ────────────────────────────────────────────────
+    def recent_turns(self, session_id: str, limit: int) -> Optional[list]:
+        """Last `limit` messages oldest-first, or None if the cache can't vouch for them"""
+        window = self._entry(session_id).turns
+        hit = window.covers(limit)
+        self._count(hit)
+        if not hit:
+            return None
+        items = list(window.items)
+        return items[-limit:] if limit else items
+
+    def turns_version(self, session_id: str) -> int:
+        """Take before querying Mongo; pass to load_turns so a write in between wins"""
+        return self._entry(session_id).turns.version
+
+    def load_turns(self, session_id: str, messages: list, fetched_limit: int, version: int):
+        if fetched_limit >= CONTEXT_CACHE_TURNS or len(messages) < fetched_limit:
+            self._entry(session_id).turns.load(messages, len(messages) < fetched_limit, version)
+
+    def add_turn(self, session_id: str, message: dict):
+        self._entry(session_id).turns.push(message)
+
+    def clear_turns(self, session_id: str):
+        window = self._entry(session_id).turns
+        window.version += 1
+        window.load([], True, window.version)
+
+    # ── memories ─────────────────────────────────────────────
+    def recent_memories(self, session_id: str, limit: int) -> Optional[list]:
+        """Newest `limit` memories newest-first, or None on a miss"""
+        window = self._entry(session_id).memories
+        hit = window.covers(limit)
+        self._count(hit)
+        if not hit:
+            return None
+        return list(window.items)[:limit]
+
+    def memories_version(self, session_id: str) -> int:
+        return self._entry(session_id).memories.version
+
+    def load_memories(self, session_id: str, memories: list, fetched_limit: int, version: int):
+        if fetched_limit >= CONTEXT_CACHE_MEMORIES or len(memories) < fetched_limit:
+            self._entry(session_id).memories.load(memories, len(memories) < fetched_limit, version)
+
+    def add_memory(self, session_id: str, memory: dict):
+        self._entry(session_id).memories.push(memory, newest_first=True)
+
+    def invalidate_memories(self, session_id: str):
+        window = self._entry(session_id).memories
+        window.version += 1
+        window.loaded_at = 0.0
+
+    # ── weekly reflection ────────────────────────────────────
+    def weekly(self, session_id: str):
+        """Latest weekly reflection (possibly None), or the MISSING sentinel on a miss"""
+        entry = self._entry(session_id)
+        hit = entry.weekly is not MISSING and time.monotonic() - entry.weekly_loaded_at < CONTEXT_CACHE_TTL
+        self._count(hit)
+        return entry.weekly if hit else MISSING
+
+    def set_weekly(self, session_id: str, reflection: Optional[dict]):
+        entry = self._entry(session_id)
+        entry.weekly = reflection
+        entry.weekly_loaded_at = time.monotonic()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# Singleton instance
+_cache: Optional[SessionContextCache] = None
+
+
+def get_context_cache() -> SessionContextCache:
+    """Get or create the session context cache singleton"""
+    global _cache
+    if _cache is None:
+        _cache = SessionContextCache()
+    return _cache
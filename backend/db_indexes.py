@@ -0,0 +1,172 @@
+"""
+MongoDB Indexes for Sam
+=======================
+Declares the indexes every hot query in server.py relies on, creates them
+idempotently at startup, and audits the query plans so a collection scan or
+in-memory sort shows up before it shows up in latency.
+
+    python db_indexes.py ensure   # create any missing indexes
+    python db_indexes.py audit    # explain() each known query shape
+"""
+
+import os
+import sys
+import asyncio
+import logging
+from pathlib import Path
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger(__name__)
+
+# collection -> indexes. Compound keys follow the query shape: equality first, then sort.
+INDEX_SPECS = {
+    "messages": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+                   name="session_timestamp"),
+        IndexModel([("session_id", ASCENDING), ("role", ASCENDING), ("timestamp", DESCENDING)],
+                   name="session_role_timestamp"),
+    ],
+    "memories": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", DESCENDING)], name="session_timestamp"),
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    "memories_archive": [
+        IndexModel([("session_id", ASCENDING), ("archived_at", DESCENDING)], name="session_archived"),
+    ],
+    "weekly_reflections": [
+        IndexModel([("session_id", ASCENDING), ("week_number", DESCENDING)], name="session_week"),
+    ],
+    "proactive_messages": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", DESCENDING)], name="session_timestamp"),
+    ],
+    "heartbeat_thoughts": [
+        IndexModel([("session_id", ASCENDING), ("timestamp", DESCENDING)], name="session_timestamp"),
+    ],
+    # Session registry (_id is the session_id)
+    "sessions": [
+        IndexModel([("last_active", DESCENDING)], name="last_active"),
+        IndexModel([("next_think_at", ASCENDING), ("last_active", DESCENDING)], name="next_think"),
+    ],
+    "leases": [
+        # Expired leases are already free; this only garbage-collects them
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+}
+
+# Every query shape the server issues: (label, collection, filter, sort)
+QUERY_SHAPES = [
+    ("conversation history", "messages", {"session_id": "_"}, [("timestamp", -1)]),
+    ("message list", "messages", {"session_id": "_"}, [("timestamp", -1), ("id", -1)]),
+    ("message page before cursor", "messages",
+     {"session_id": "_", "timestamp": {"$lte": "_"}, "$or": [{"timestamp": {"$lt": "_"}}, {"id": {"$lt": "_"}}]},
+     [("timestamp", -1), ("id", -1)]),
+    ("message delta since cursor", "messages",
+     {"session_id": "_", "timestamp": {"$gte": "_"}, "$or": [{"timestamp": {"$gt": "_"}}, {"id": {"$gt": "_"}}]},
+     [("timestamp", 1), ("id", 1)]),
+    ("user messages for weekly reflection", "messages", {"session_id": "_", "role": "user"}, [("timestamp", -1)]),
+    ("recent memories", "memories", {"session_id": "_"}, [("timestamp", -1)]),
+    ("memory graph", "memories", {"session_id": "_"}, None),
+    ("memory by id (compaction)", "memories", {"id": "_"}, None),
+    ("memories missing from the vector index", "memories", {"id": {"$in": ["_"]}}, [("timestamp", 1)]),
+    ("archived ids for the vector index", "memories_archive", {"session_id": "_", "id": {"$in": ["_"]}}, None),
+    ("latest weekly reflection", "weekly_reflections", {"session_id": "_"}, [("week_number", -1)]),
+    ("proactive messages", "proactive_messages", {"session_id": "_"}, [("timestamp", -1)]),
+    ("heartbeat thoughts", "heartbeat_thoughts", {"session_id": "_"}, [("timestamp", -1)]),
+    ("session list", "sessions", {"last_active": {"$gt": ""}}, [("last_active", -1)]),
+    ("sessions starving to think", "sessions",
+     {"last_active": {"$gte": "2000-01-01"}, "next_think_at": {"$lte": "2000-01-01"}},
+     [("next_think_at", 1)]),
+    ("sessions due to think", "sessions",
+     {"last_active": {"$gte": "2000-01-01"},
+      "$or": [{"next_think_at": {"$gt": "2000-01-01", "$lte": "2000-01-02"}}, {"next_think_at": {"$exists": False}}]},
+     [("last_active", -1)]),
+    ("quiet sessions for check-ins", "sessions", {"last_active": {"$gte": "2000-01-01", "$lte": "2000-01-02"}},
+     [("last_active", -1)]),
+]
+
+
+async def ensure_indexes(db) -> dict:
+    """Create any missing indexes. Safe to run on every startup."""
+    created = {}
+    for collection, indexes in INDEX_SPECS.items():
+        try:
+            created[collection] = await db[collection].create_indexes(indexes)
+        except Exception as e:
+            logger.warning(f"Index creation failed for {collection}: {e}")
+    return created
+
+
+def _plan_stages(plan: dict) -> list:
+    """Flatten a winningPlan tree into its stage names"""
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            for child in plan["inputStages"]:
+                stages.extend(_plan_stages(child))
+            break
+        else:
+            break
+    return stages
+
+
+async def audit_query_plans(db) -> list:
+    """explain() every known query shape and flag collection scans and in-memory sorts"""
+    report = []
+    for label, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query, {"_id": 0}).limit(50)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explained = await cursor.explain()
+        except Exception as e:
+            report.append({"query": label, "collection": collection, "error": str(e)})
+            continue
+        planner = explained.get("queryPlanner", {})
+        winning = planner.get("winningPlan", {})
+        # Newer servers wrap the classic plan in queryPlan
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        report.append({
+            "query": label,
+            "collection": collection,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages,
+            "in_memory_sort": "SORT" in stages,
+            "ok": "COLLSCAN" not in stages and "SORT" not in stages,
+        })
+    return report
+
+
+async def _main(command: str) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / ".env")
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ["DB_NAME"]]
+    try:
+        if command == "ensure":
+            for collection, names in (await ensure_indexes(db)).items():
+                print(f"{collection}: {', '.join(names)}")
+            return 0
+        report = await audit_query_plans(db)
+        for row in report:
+            if "error" in row:
+                print(f"ERROR  {row['collection']:<20} {row['query']}: {row['error']}")
+            else:
+                flag = "ok   " if row["ok"] else "SCAN " if row["collection_scan"] else "SORT "
+                print(f"{flag}  {row['collection']:<20} {row['query']:<40} {' <- '.join(row['stages'])}")
+        return 0 if all(row.get("ok") for row in report) else 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "audit"
+    if cmd not in ("ensure", "audit"):
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(cmd)))
@@ -0,0 +1,140 @@
+"""
+Mongo Leases for Sam
+====================
+Claims on units of background work, shared by every worker process and
+replica. A lease is one document in `leases` keyed by what it guards
+("proactive:<session>", "compact:<session>", ...) with an owner and an
+expiry. Taking it is a single conditional upsert — free or expired or
+already ours → we own it; otherwise the upsert collides on _id and we don't
+— so there's no separate lock service and a crashed holder simply times out.
+
+`hold()` renews the lease in the background for as long as the work runs
+and releases it afterwards. It yields a `Lease` that is true while we own
+the key and turns false (`lost`) once a renewal finds it taken or it can't be
+renewed before it would expire; holders check it again right before side
+effects, so work that outlived its lease doesn't run twice. A lease acquired and deliberately not released
+doubles as "done recently" for loops that should run once per interval
+across the whole deployment.
+"""
+
+import os
+import time
+import socket
+import asyncio
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+LEASE_TTL = float(os.environ.get("LEASE_TTL", "300"))
+
+
+class Lease:
+    """What `hold()` yields — truthy while the key is ours"""
+
+    def __init__(self, key: str, owned: bool):
+        self.key = key
+        self.owned = owned
+        self.lost = False
+
+    def __bool__(self) -> bool:
+        return self.owned and not self.lost
+
+
+class LeaseManager:
+    """Acquire / renew / release expiring leases in Mongo"""
+
+    def __init__(self, db, owner: str = None):
+        self.db = db
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.held: set = set()
+        self.acquired = 0
+        self.contended = 0
+        self.lost = 0
+
+    async def acquire(self, key: str, ttl: float = LEASE_TTL) -> bool:
+        now = datetime.now(timezone.utc)
+        try:
+            await self.db.leases.update_one(
+                {"_id": key, "$or": [{"expires_at": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=ttl), "acquired_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            self.contended += 1  # someone else holds it and it hasn't expired
+            return False
+        self.held.add(key)
+        self.acquired += 1
+        return True
+
+    async def renew(self, key: str, ttl: float = LEASE_TTL) -> bool:
+        result = await self.db.leases.update_one(
+            {"_id": key, "owner": self.owner},
+            {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl)}},
+        )
+        return result.matched_count == 1
+
+    async def release(self, key: str):
+        self.held.discard(key)
+        try:
+            await self.db.leases.delete_one({"_id": key, "owner": self.owner})
+        except Exception as e:
+            logger.warning(f"Lease release failed for {key} (it will expire): {e}")
+
+    @asynccontextmanager
+    async def hold(self, key: str, ttl: float = LEASE_TTL):
+        """`async with leases.hold(key) as lease:` — work only while `lease` is true; renewed until the block exits"""
+        if not await self.acquire(key, ttl):
+            yield Lease(key, False)
+            return
+        lease = Lease(key, True)
+        renewer = asyncio.create_task(self._keep(lease, ttl))
+        try:
+            yield lease
+        finally:
+            renewer.cancel()
+            await self.release(key)
+
+    async def _keep(self, lease: Lease, ttl: float):
+        renewed = time.monotonic()
+        while True:
+            await asyncio.sleep(ttl / 3)
+            try:
+                if await self.renew(lease.key, ttl):
+                    renewed = time.monotonic()
+                    continue
+                logger.warning(f"Lease {lease.key} was lost while in use")
+            except Exception as e:
+                logger.warning(f"Lease renewal failed for {lease.key}: {e}")
+                if time.monotonic() - renewed < ttl * 2 / 3:
+                    continue  # still ours for now; try again next round
+                logger.warning(f"Lease {lease.key} may have expired; giving it up")
+            lease.lost = True
+            self.lost += 1
+            return
+
+    def stats(self) -> dict:
+        return {
+            "owner": self.owner,
+            "held": len(self.held),
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "lost": self.lost,
+        }
+
+
+# Singleton instance
+_leases: Optional[LeaseManager] = None
+
+
+def get_lease_manager(db) -> LeaseManager:
+    """Get or create the lease manager singleton"""
+    global _leases
+    if _leases is None:
+        _leases = LeaseManager(db)
+    return _leases
@@ -0,0 +1,206 @@
+"""
+Lexicon Engine for Sam
+======================
+Keyword classification for emotions and memory extraction in one pass.
+
+Every keyword from every group is compiled into a single trie-shaped regex
+wrapped in a lookahead, so the text is walked once and each position costs
+roughly one trie descent however many keywords there are. At each position
+the regex yields the longest keyword starting there; every shorter keyword
+starting at the same position is a prefix of it, so a precomputed prefix
+closure turns that one match into all of them. Matching is plain substring
+matching on the lowercased text — the same semantics as the `any(w in t ...)`
+checks it replaces.
+
+Groups are ordered {label: [keywords]} maps; `first()` honours that order,
+which is how detect_emotion's priority is expressed. A deployment can extend
+the built-in lists with a JSON file of the same shape via LEXICON_PATH.
+
+    python lexicon.py          # microbenchmark vs. the old any() loops
+"""
+
+import os
+import re
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LEXICON_PATH = os.environ.get("LEXICON_PATH", "")
+
+DEFAULT_LEXICON: Dict[str, Dict[str, List[str]]] = {
+    # Priority order matters: the first label that matches wins
+    "emotion": {
+        "laughing": ["haha", "heh", "funny", "hilarious", "laugh", "lol"],
+        "affectionate": ["love", "adore", "beautiful", "miss you", "heart", "tender", "hold"],
+        "thinking": ["think", "wonder", "curious", "fascinating", "interesting", "hmm", "notice"],
+        "tender": ["sorry", "sad", "hard", "difficult", "miss", "lost", "wish"],
+        "excited": ["excited", "amazing", "wow", "incredible", "yes!", "love this"],
+        "whisper": ["whisper", "quiet", "soft", "gentle", "shh"],
+    },
+    # What the user said that is worth remembering
+    "memory": {
+        "identity": ["my name is", "i'm called", "call me", "i go by"],
+        "preference": ["i love", "i hate", "i enjoy", "i prefer", "my favorite", "i can't stand"],
+        "event": ["today", "yesterday", "this morning", "i had", "i went", "we went", "just got back"],
+        "feeling": ["i feel", "i'm feeling", "feeling", "i'm sad", "i'm happy", "anxious", "stressed", "excited"],
+        "relationship": ["my friend", "my mom", "my dad", "my sister", "my brother", "my partner", "my boss",
+                         "my dog", "my cat"],
+        "occasion": ["birthday", "anniversary", "holiday", "remember when", "last year"],
+    },
+    # Sam's own lines worth keeping as thoughts
+    "reflection": {
+        "reflection": ["i've been thinking", "i wonder", "i love that", "that moves me"],
+    },
+}
+
+
+class LexiconMatch:
+    """Labels found in one text, per group"""
+
+    __slots__ = ("_lexicon", "_hits")
+
+    def __init__(self, lexicon: "Lexicon", hits: set):
+        self._lexicon = lexicon
+        self._hits = hits
+
+    def has(self, group: str, label: str) -> bool:
+        return (group, label) in self._hits
+
+    def labels(self, group: str) -> List[str]:
+        """Matched labels of `group`, in lexicon order"""
+        return [label for label in self._lexicon.groups.get(group, ()) if (group, label) in self._hits]
+
+    def first(self, group: str, default: Optional[str] = None) -> Optional[str]:
+        for label in self._lexicon.groups.get(group, ()):
+            if (group, label) in self._hits:
+                return label
+        return default
+
+
+def _trie_pattern(words) -> str:
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        terminal = "" in node
+        leaves = sorted(ch for ch, child in node.items() if ch and list(child) == [""])
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items())
+                    if ch and list(child) != [""]]
+        alts = branches[:]
+        if len(leaves) == 1:
+            alts.append(re.escape(leaves[0]))
+        elif leaves:
+            alts.append("[" + "".join(re.escape(ch) for ch in leaves) + "]")
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        # Greedy optional: prefer the longer keyword, fall back to this one
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+
+class Lexicon:
+    """All keyword groups compiled into one scanner"""
+
+    def __init__(self, groups: Dict[str, Dict[str, List[str]]]):
+        self.groups = {g: dict(labels) for g, labels in groups.items()}
+        owners: Dict[str, set] = {}
+        for group, labels in self.groups.items():
+            for label, words in labels.items():
+                for w in words:
+                    w = w.lower()
+                    if w:
+                        owners.setdefault(w, set()).add((group, label))
+        # keyword -> every (group, label) whose keyword is a prefix of it (itself included)
+        self._closure = {
+            w: frozenset().union(*(owners[w[:i]] for i in range(1, len(w) + 1) if w[:i] in owners))
+            for w in owners
+        }
+        self.size = len(owners)
+        self._regex = re.compile(f"(?=({_trie_pattern(owners)}))") if owners else None
+
+    def scan(self, text: str) -> LexiconMatch:
+        hits: set = set()
+        if self._regex is not None and text:
+            closure = self._closure
+            for m in self._regex.finditer(text.lower()):
+                hits |= closure[m.group(1)]
+        return LexiconMatch(self, hits)
+
+    @classmethod
+    def load(cls, path: str = "") -> "Lexicon":
+        """Built-in lists, extended by a JSON file of the same shape if `path` is given"""
+        groups = {g: {label: list(words) for label, words in labels.items()} for g, labels in DEFAULT_LEXICON.items()}
+        if path:
+            try:
+                extra = json.loads(Path(path).read_text(encoding="utf-8"))
+                for group, labels in extra.items():
+                    for label, words in labels.items():
+                        groups.setdefault(group, {}).setdefault(label, []).extend(words)
+                logger.info(f"Lexicon extended from {path}")
+            except Exception as e:
+                logger.warning(f"Could not load lexicon {path} ({e}), using built-in lists")
+        return cls(groups)
+
+
+# Singleton instance
+_lexicon: Optional[Lexicon] = None
+
+
+def get_lexicon() -> Lexicon:
+    """Get or create the lexicon singleton"""
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = Lexicon.load(LEXICON_PATH)
+    return _lexicon
+
+
+def _bench():
+    import random
+    import string
+    import timeit
+
+    samples = [
+        "haha that's so funny, I can't stop laughing at my dog today",
+        "I'm feeling really stressed about my job interview tomorrow, my boss is being difficult",
+        "My name is Alex and I love hiking. Yesterday we went to the mountains for my sister's birthday.",
+        "Not much going on. Just sitting here with some tea, watching the rain.",
+        "I've been thinking about what you said — I wonder if that's why it's hard for you to rest.",
+    ]
+
+    def naive(groups, text):
+        t = text.lower()
+        return {(g, label) for g, labels in groups.items() for label, words in labels.items()
+                if any(w in t for w in words)}
+
+    lex = Lexicon(DEFAULT_LEXICON)
+    for text in samples:
+        assert {hit for hit in naive(DEFAULT_LEXICON, text)} == lex.scan(text)._hits, text
+
+    def per_call_us(fn, n=2000) -> float:
+        return timeit.timeit(fn, number=n) / (n * len(samples)) * 1e6
+
+    print(f"{'keywords':>9}  {'any() loops':>12}  {'compiled':>10}")
+    rng = random.Random(7)
+    for extra in (0, 500, 5000, 50000):
+        groups = {g: {label: list(words) for label, words in labels.items()} for g, labels in DEFAULT_LEXICON.items()}
+        for i in range(extra):
+            word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+            groups["memory"].setdefault(f"extra{i % 20}", []).append(word)
+        lex = Lexicon(groups)
+        n = 2000 if extra < 5000 else 50
+        slow = per_call_us(lambda: [naive(groups, t) for t in samples], n)
+        fast = per_call_us(lambda: [lex.scan(t) for t in samples], n)
+        print(f"{lex.size:>9}  {slow:>10.1f}us  {fast:>8.1f}us")
+
+
+if __name__ == "__main__":
+    _bench()
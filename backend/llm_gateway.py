@@ -0,0 +1,264 @@
+"""
+LLM Gateway for Sam
+===================
+Every model call — live chat, on-demand endpoints, background cognition —
+is admitted through here, so a heartbeat cycle can't push us into provider
+rate limits while someone is mid-conversation.
+
+  - Priority classes: interactive > on_demand > background. Waiters are
+    considered in that order (FIFO within a class); a lower class only goes
+    first when the one ahead is waiting on a different provider's budget.
+  - Bounded concurrency: at most LLM_CONCURRENCY calls in flight overall,
+    and at most LLM_BACKGROUND_MAX of them background.
+  - Rate budget: a token bucket per provider (LLM_RPM, or LLM_RPM_<PROVIDER>)
+    refilled continuously. Background calls leave LLM_INTERACTIVE_RESERVE of
+    the bucket untouched for chat. A rate-limit error from the provider
+    empties its bucket so everyone backs off together.
+  - Background yields: while LLM_INTERACTIVE_HIGH or more interactive calls
+    are running or waiting, background calls are not admitted at all.
+
+The limits are deployment-wide: each process enforces its share, the
+configured value divided by LLM_WORKERS (defaulting to WEB_CONCURRENCY, the
+process count the server was started with), rounded down but never below
+one. Set LLM_WORKERS to the total number of processes across replicas.
+
+    async with llm_gateway.slot("openai", INTERACTIVE): ...
+    text = await llm_gateway.run("emergent", BACKGROUND, lambda: chat.send_message(msg))
+"""
+
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+ON_DEMAND = "on_demand"
+BACKGROUND = "background"
+PRIORITIES = {INTERACTIVE: 0, ON_DEMAND: 1, BACKGROUND: 2}
+
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "8"))
+LLM_BACKGROUND_MAX = int(os.environ.get("LLM_BACKGROUND_MAX", "3"))
+LLM_INTERACTIVE_HIGH = int(os.environ.get("LLM_INTERACTIVE_HIGH", "4"))
+LLM_INTERACTIVE_RESERVE = float(os.environ.get("LLM_INTERACTIVE_RESERVE", "0.25"))
+LLM_RPM = float(os.environ.get("LLM_RPM", "300"))
+LLM_WORKERS = max(1, int(os.environ.get("LLM_WORKERS", os.environ.get("WEB_CONCURRENCY", "1"))))
+
+
+def _share(total: float) -> float:
+    """This process's slice of a deployment-wide limit"""
+    return total / LLM_WORKERS
+
+
+def _share_count(total: int) -> int:
+    return max(1, total // LLM_WORKERS)
+
+
+def _is_rate_limit(error: Exception) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return "ratelimit" in text or "rate limit" in text or "429" in text
+
+
+class _Bucket:
+    """Token bucket: `rpm` requests a minute, bursts up to ten seconds' worth"""
+
+    def __init__(self, rpm: float):
+        self.rpm = rpm
+        self.rate = rpm / 60.0
+        self.capacity = max(1.0, self.rate * 10)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait(self, reserve: float = 0.0) -> float:
+        """Seconds until a token is available above `reserve` (0 = now)"""
+        self._refill()
+        need = 1.0 + reserve * self.capacity - self.tokens
+        return need / self.rate if need > 0 else 0.0
+
+    def take(self):
+        self.tokens -= 1.0
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+        self.throttled += 1
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "priority", "provider", "future", "enqueued", "yielded")
+
+    def __init__(self, priority: str, provider: str, seq: int):
+        self.rank = PRIORITIES[priority]
+        self.seq = seq
+        self.priority = priority
+        self.provider = provider
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+        self.yielded = False
+
+
+class _ClassStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.wait_ms = 0.0   # running average
+        self.max_wait_ms = 0.0
+
+
+class LlmGateway:
+    """Priority admission + per-provider rate budget + global concurrency cap"""
+
+    def __init__(self, concurrency: int = _share_count(LLM_CONCURRENCY),
+                 background_max: int = _share_count(LLM_BACKGROUND_MAX)):
+        self.concurrency = concurrency
+        self.background_max = background_max
+        self._waiting: list = []
+        self._seq = 0
+        self._in_flight = 0
+        self._buckets: dict = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._classes = {p: _ClassStats() for p in PRIORITIES}
+        self.yielded = 0
+
+    def bucket(self, provider: str) -> _Bucket:
+        b = self._buckets.get(provider)
+        if b is None:
+            rpm = float(os.environ.get(f"LLM_RPM_{provider.upper()}", LLM_RPM))
+            b = self._buckets[provider] = _Bucket(_share(rpm))
+        return b
+
+    # ── admission ────────────────────────────────────────────
+    def _interactive_load(self) -> int:
+        waiting = sum(1 for w in self._waiting if w.priority == INTERACTIVE and not w.future.done())
+        return self._classes[INTERACTIVE].in_flight + waiting
+
+    def _blocked_for(self, w: _Waiter) -> Optional[float]:
+        """None if `w` can't run for a load reason, else seconds until its bucket allows it (0 = now)"""
+        if w.priority == BACKGROUND:
+            if self._interactive_load() >= LLM_INTERACTIVE_HIGH:
+                if not w.yielded:
+                    w.yielded = True
+                    self.yielded += 1
+                return None
+            if self._classes[BACKGROUND].in_flight >= self.background_max:
+                return None
+            return self.bucket(w.provider).wait(LLM_INTERACTIVE_RESERVE)
+        return self.bucket(w.provider).wait()
+
+    def _pump(self):
+        self._timer = None
+        retry_in = None
+        self._waiting.sort(key=lambda w: (w.rank, w.seq))
+        i = 0
+        while i < len(self._waiting) and self._in_flight < self.concurrency:
+            w = self._waiting[i]
+            if w.future.done():  # cancelled while waiting
+                self._waiting.pop(i)
+                continue
+            wait = self._blocked_for(w)
+            if wait == 0.0:
+                self._waiting.pop(i)
+                self.bucket(w.provider).take()
+                self._in_flight += 1
+                self._classes[w.priority].in_flight += 1
+                w.future.set_result(None)
+                continue
+            if wait is not None:
+                retry_in = wait if retry_in is None else min(retry_in, wait)
+            i += 1
+        if retry_in is not None:
+            self._timer = asyncio.get_running_loop().call_later(retry_in, self._pump)
+
+    def _release(self, priority: str):
+        self._in_flight -= 1
+        self._classes[priority].in_flight -= 1
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pump()
+
+    @asynccontextmanager
+    async def slot(self, provider: str, priority: str = INTERACTIVE):
+        """Hold one admitted call for the duration of the block"""
+        self._seq += 1
+        w = _Waiter(priority, provider, self._seq)
+        self._waiting.append(w)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pump()
+        try:
+            await w.future
+        except asyncio.CancelledError:
+            if w.future.done() and not w.future.cancelled():
+                self._release(priority)  # admitted just as we were cancelled
+            else:
+                w.future.cancel()
+            raise
+        stats = self._classes[priority]
+        waited = (time.monotonic() - w.enqueued) * 1000
+        stats.wait_ms = waited if not stats.completed else 0.9 * stats.wait_ms + 0.1 * waited
+        stats.max_wait_ms = max(stats.max_wait_ms, waited)
+        try:
+            yield
+        except Exception as e:
+            stats.errors += 1
+            if _is_rate_limit(e):
+                self.bucket(provider).drain()
+                logger.warning(f"LLM provider {provider} rate-limited us; pausing its budget")
+            raise
+        finally:
+            stats.completed += 1
+            self._release(priority)
+
+    async def run(self, provider: str, priority: str, call: Callable[[], Awaitable]):
+        async with self.slot(provider, priority):
+            return await call()
+
+    def stats(self) -> dict:
+        queued = {p: 0 for p in PRIORITIES}
+        for w in self._waiting:
+            if not w.future.done():
+                queued[w.priority] += 1
+        return {
+            "workers": LLM_WORKERS,
+            "concurrency": self.concurrency,
+            "background_max": self.background_max,
+            "in_flight": self._in_flight,
+            "background_yields": self.yielded,
+            "classes": {
+                p: {
+                    "queued": queued[p],
+                    "in_flight": c.in_flight,
+                    "completed": c.completed,
+                    "errors": c.errors,
+                    "avg_wait_ms": round(c.wait_ms, 1),
+                    "max_wait_ms": round(c.max_wait_ms, 1),
+                }
+                for p, c in self._classes.items()
+            },
+            "providers": {
+                name: {"rpm": b.rpm, "tokens": round(max(b.tokens, 0.0), 1), "throttled": b.throttled}
+                for name, b in self._buckets.items()
+            },
+        }
+
+
+# Singleton instance
+_gateway: Optional[LlmGateway] = None
+
+
+def get_llm_gateway() -> LlmGateway:
+    """Get or create the LLM gateway singleton"""
+    global _gateway
+    if _gateway is None:
+        _gateway = LlmGateway()
+    return _gateway
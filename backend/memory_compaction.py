@@ -0,0 +1,318 @@
+"""
+Memory Compaction for Sam
+=========================
+Keeps each session's `memories` small and high-signal as it ages. A
+background pass over recently active sessions:
+
+  1. rolls heartbeat thoughts older than COMPACT_ROLLUP_HOURS up into one
+     digest memory per day,
+  2. merges near-duplicate memories within a category (cosine similarity of
+     the same hashed embeddings the vector index uses), keeping the newest,
+  3. decays `weight` from the memory's `base_weight` with a half-life,
+  4. and, past COMPACT_MAX_LIVE memories, retires the faintest ones.
+
+Nothing is deleted outright: rolled-up, merged and faded memories are moved
+to `memories_archive` with the reason and, where relevant, the id of the
+memory that absorbed them. With a lease manager, each session is compacted
+under a "compact:<session>" lease so workers never process it twice.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+from pymongo import UpdateOne
+
+from leases import LeaseManager
+from vector_index import HashingEmbedder
+
+logger = logging.getLogger(__name__)
+
+COMPACT_INTERVAL = int(os.environ.get("COMPACT_INTERVAL", str(6 * 3600)))
+COMPACT_ACTIVE_DAYS = int(os.environ.get("COMPACT_ACTIVE_DAYS", "30"))
+COMPACT_DUP_THRESHOLD = float(os.environ.get("COMPACT_DUP_THRESHOLD", "0.85"))
+COMPACT_HALF_LIFE_DAYS = float(os.environ.get("COMPACT_HALF_LIFE_DAYS", "30"))
+COMPACT_MIN_WEIGHT = float(os.environ.get("COMPACT_MIN_WEIGHT", "0.2"))
+COMPACT_ROLLUP_HOURS = int(os.environ.get("COMPACT_ROLLUP_HOURS", "24"))
+COMPACT_MAX_LIVE = int(os.environ.get("COMPACT_MAX_LIVE", "400"))
+
+HEARTBEAT_PREFIX = "[Heartbeat thought"
+DIGEST_PREFIX = "[Thought digest"
+
+
+def _parse_ts(ts: str) -> Optional[datetime]:
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+def _thought_text(content: str) -> str:
+    """Strip the "[Heartbeat thought — type]: " prefix"""
+    return content.split("]:", 1)[1].strip() if content.startswith("[") and "]:" in content else content
+
+
+def extractive_digest(thoughts: list) -> str:
+    """Fallback digest: the first sentence of a few of the day's thoughts"""
+    picked = []
+    for t in thoughts:
+        first = t.split(". ")[0].strip().rstrip(".")
+        if first and first not in picked:
+            picked.append(first)
+        if len(picked) == 3:
+            break
+    return ". ".join(picked) + ("." if picked else "")
+
+
+class MemoryCompactor:
+    """Per-session roll-up, dedupe, decay and archive"""
+
+    def __init__(self, db,
+                 save_memory: Callable[[dict], Awaitable[None]],
+                 forget: Callable[[str, list], Awaitable[None]],
+                 summarize: Callable[[str, list], Awaitable[str]] = None,
+                 embedder: HashingEmbedder = None,
+                 leases: LeaseManager = None):
+        self.db = db
+        self.save_memory = save_memory  # persists a new digest memory
+        self.forget = forget            # called with (session_id, archived ids) after a pass
+        self.summarize = summarize      # (day, thoughts) -> digest text
+        self.embedder = embedder or HashingEmbedder()
+        self.leases = leases
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()  # one pass at a time, whether from the loop or the admin endpoint
+        self.runs = 0
+        self.sessions = 0
+        self.skipped = 0
+        self.archived = {"rolled_up": 0, "duplicate": 0, "faded": 0}
+        self.digests = 0
+        self.reweighted = 0
+        self.last_run_at = None
+        self.last_run_ms = 0.0
+
+    async def _digest_text(self, day: str, thoughts: list) -> str:
+        if self.summarize:
+            try:
+                text = (await self.summarize(day, thoughts) or "").strip()
+                if text:
+                    return text
+            except Exception as e:
+                logger.warning(f"Thought digest summary failed, using extractive digest: {e}")
+        return extractive_digest(thoughts)
+
+    async def compact_session(self, session_id: str, unless_since: str = None) -> dict:
+        """Compact one session; with `unless_since`, skip it if it was compacted after that time"""
+        async with self._lock:
+            if self.leases is None:
+                return await self._compact_once(session_id, unless_since)
+            async with self.leases.hold(f"compact:{session_id}") as lease:
+                if not lease:
+                    self.skipped += 1
+                    return {"session_id": session_id, "skipped": "being compacted by another worker"}
+                return await self._compact_once(session_id, unless_since, lease)
+
+    async def _compact_once(self, session_id: str, unless_since: str = None, lease=None) -> dict:
+        if unless_since:
+            # Re-check under the lease: another worker may have just finished this session
+            doc = await self.db.sessions.find_one({"_id": session_id}, {"compacted_at": 1})
+            if (doc or {}).get("compacted_at", "") > unless_since:
+                self.skipped += 1
+                return {"session_id": session_id, "skipped": "recently compacted"}
+        report = await self._compact(session_id, lease)
+        if report.get("skipped"):
+            return report
+        await self.db.sessions.update_one(
+            {"_id": session_id}, {"$set": {"compacted_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        return report
+
+    async def _compact(self, session_id: str, lease=None) -> dict:
+        mems = await self.db.memories.find({"session_id": session_id}, {"_id": 0}).sort("timestamp", 1).to_list(None)
+        now = datetime.now(timezone.utc)
+        archive: dict = {}  # id -> (doc, reason, merged_into)
+        digests = []
+
+        # 1. Roll old heartbeat thoughts up into one digest per (whole, UTC) day
+        cutoff_day = (now - timedelta(hours=COMPACT_ROLLUP_HOURS)).date().isoformat()
+        by_day: dict = {}
+        for m in mems:
+            if m.get("content", "").startswith(HEARTBEAT_PREFIX) and m.get("timestamp", "")[:10] < cutoff_day:
+                by_day.setdefault(m["timestamp"][:10], []).append(m)
+        for day, group in sorted(by_day.items()):
+            if len(group) < 2:
+                continue
+            text = await self._digest_text(day, [_thought_text(m["content"]) for m in group])
+            digest = {
+                "id": str(uuid.uuid4()),
+                "session_id": session_id,
+                "content": f"{DIGEST_PREFIX} — {day}, {len(group)} thoughts]: {text}",
+                "category": "thought",
+                "sentiment": "curiosity",
+                "timestamp": max(m["timestamp"] for m in group),
+                "weight": max(m.get("base_weight", m.get("weight", 1.0)) for m in group),
+            }
+            digests.append(digest)
+            for m in group:
+                archive[m["id"]] = (m, "rolled_up", digest["id"])
+
+        # 2. Merge near-duplicates within a category, newest survives
+        live = [m for m in mems if m["id"] not in archive]
+        merged_into: dict = {}  # survivor id -> list of absorbed docs
+        if live:
+            vectors = await asyncio.to_thread(lambda: np.stack([self.embedder.embed(m.get("content", "")) for m in live]))
+            by_cat: dict = {}
+            for i, m in enumerate(live):
+                by_cat.setdefault(m.get("category", ""), []).append(i)
+            for idxs in by_cat.values():
+                kept: list = []
+                for i in reversed(idxs):  # newest first
+                    if kept:
+                        sims = vectors[kept] @ vectors[i]
+                        best = int(np.argmax(sims))
+                        if sims[best] >= COMPACT_DUP_THRESHOLD:
+                            survivor = live[kept[best]]
+                            merged_into.setdefault(survivor["id"], []).append(live[i])
+                            archive[live[i]["id"]] = (live[i], "duplicate", survivor["id"])
+                            continue
+                    kept.append(i)
+        live = [m for m in live if m["id"] not in archive]
+
+        # 3. Decay weights from their base weight
+        updates = {}
+        decayed = {}
+        for m in live:
+            absorbed = merged_into.get(m["id"], [])
+            base = max([m.get("base_weight", m.get("weight", 1.0))] +
+                       [a.get("base_weight", a.get("weight", 1.0)) for a in absorbed])
+            ts = _parse_ts(m.get("timestamp", ""))
+            age_days = (now - ts).total_seconds() / 86400 if ts else 0.0
+            weight = round(max(COMPACT_MIN_WEIGHT, base * 0.5 ** (age_days / COMPACT_HALF_LIFE_DAYS)), 3)
+            decayed[m["id"]] = weight
+            fields = {}
+            if m.get("base_weight") != base:
+                fields["base_weight"] = base
+            if abs(m.get("weight", 1.0) - weight) >= 0.01:
+                fields["weight"] = weight
+            if absorbed:
+                fields["merged_count"] = m.get("merged_count", 0) + sum(1 + a.get("merged_count", 0) for a in absorbed)
+            if fields:
+                updates[m["id"]] = fields
+
+        # 4. Retire the faintest memories past the live cap (digests count toward it)
+        overflow = len(live) + len(digests) - COMPACT_MAX_LIVE
+        if overflow > 0:
+            faintest = sorted(live, key=lambda m: (decayed[m["id"]], m.get("timestamp", "")))[:overflow]
+            for m in faintest:
+                archive[m["id"]] = (m, "faded", None)
+                updates.pop(m["id"], None)
+
+        if lease is not None and not lease:
+            self.skipped += 1
+            return {"session_id": session_id, "skipped": "lease lost before writing"}
+
+        # Write: archive first, then remove, so a crash can only leave an extra archived copy
+        archived_at = now.isoformat()
+        if archive:
+            await self.db.memories_archive.insert_many([
+                {**doc, "archived_at": archived_at, "archive_reason": reason, "merged_into": into}
+                for doc, reason, into in archive.values()
+            ], ordered=False)
+            await self.db.memories.delete_many({"id": {"$in": list(archive)}})
+        if updates:
+            await self.db.memories.bulk_write(
+                [UpdateOne({"id": mid}, {"$set": fields}) for mid, fields in updates.items()], ordered=False
+            )
+        for digest in digests:
+            await self.save_memory(digest)
+        if archive or updates:
+            await self.forget(session_id, list(archive))
+
+        reasons = Counter(reason for _, reason, _ in archive.values())
+        for reason, n in reasons.items():
+            self.archived[reason] += n
+        self.digests += len(digests)
+        self.reweighted += len(updates)
+        self.sessions += 1
+        return {
+            "session_id": session_id,
+            "before": len(mems),
+            "after": len(mems) - len(archive) + len(digests),
+            "digests": len(digests),
+            "archived": dict(reasons),
+            "reweighted": len(updates),
+        }
+
+    async def run_once(self) -> list:
+        started = time.perf_counter()
+        since = (datetime.now(timezone.utc) - timedelta(days=COMPACT_ACTIVE_DAYS)).isoformat()
+        stale = (datetime.now(timezone.utc) - timedelta(seconds=COMPACT_INTERVAL)).isoformat()
+        sessions = await self.db.sessions.find(
+            {"last_active": {"$gte": since}}, {"_id": 0, "session_id": 1, "compacted_at": 1}
+        ).to_list(None)
+        reports = []
+        for s in sessions:
+            if s.get("compacted_at", "") > stale:
+                continue
+            try:
+                report = await self.compact_session(s["session_id"], unless_since=stale)
+                if report.get("skipped"):
+                    continue
+                reports.append(report)
+                if report["before"] != report["after"]:
+                    logger.info(f"Compacted memories for {s['session_id']}: {report['before']} → {report['after']}")
+            except Exception as e:
+                logger.error(f"Memory compaction error for {s['session_id']}: {e}")
+            await asyncio.sleep(0)
+        self.runs += 1
+        self.last_run_at = datetime.now(timezone.utc).isoformat()
+        self.last_run_ms = round((time.perf_counter() - started) * 1000, 1)
+        return reports
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        await asyncio.sleep(120)  # let startup settle
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Memory compaction cycle error: {e}")
+            await asyncio.sleep(COMPACT_INTERVAL)
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "sessions_compacted": self.sessions,
+            "sessions_skipped": self.skipped,
+            "archived": dict(self.archived),
+            "digests": self.digests,
+            "reweighted": self.reweighted,
+            "last_run_at": self.last_run_at,
+            "last_run_ms": self.last_run_ms,
+        }
+
+
+# Singleton instance
+_compactor: Optional[MemoryCompactor] = None
+
+
+def get_memory_compactor(db, **hooks) -> MemoryCompactor:
+    """Get or create the memory compactor singleton"""
+    global _compactor
+    if _compactor is None:
+        _compactor = MemoryCompactor(db, **hooks)
+    return _compactor
@@ -0,0 +1,374 @@
+"""
+Memory Graph Snapshots for Sam
+==============================
+Per-session node/link graph behind /api/memories/{session_id}/graph, kept
+up to date instead of rebuilt from Mongo on every MemoryGarden load.
+
+Each session's memories carry a change version (`versions.memories`, see
+change_versions.py), bumped whenever they change. The in-process snapshot is
+tagged with the version it reflects and carries a bounded log of changes,
+so clients can ask for "everything since version N". A snapshot that falls
+behind the stored version (another worker wrote, or a change was too broad
+to apply incrementally) is rebuilt on next use. The serialized full body is
+cached per version.
+
+Optionally the snapshot also carries semantic memory-to-memory links: each
+memory is linked to its GRAPH_SEMANTIC_K most similar memories above
+GRAPH_SEMANTIC_THRESHOLD (cosine over the vector index's embeddings). The
+layer is built on first request with blockwise matrix products — never the
+full n×n matrix at once — and new memories are folded in with one k×n
+product instead of a rebuild.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from change_versions import ChangeVersions
+
+logger = logging.getLogger(__name__)
+
+GRAPH_SESSIONS = int(os.environ.get("GRAPH_SESSIONS", "200"))
+GRAPH_LOG_SIZE = int(os.environ.get("GRAPH_LOG_SIZE", "500"))
+GRAPH_SEMANTIC_K = int(os.environ.get("GRAPH_SEMANTIC_K", "3"))
+GRAPH_SEMANTIC_THRESHOLD = float(os.environ.get("GRAPH_SEMANTIC_THRESHOLD", "0.3"))
+GRAPH_SEMANTIC_BLOCK = int(os.environ.get("GRAPH_SEMANTIC_BLOCK", "512"))
+
+_PROJECTION = {"_id": 0, "id": 1, "content": 1, "category": 1, "sentiment": 1, "weight": 1, "timestamp": 1}
+
+
+def category_node(cat: str) -> dict:
+    return {"id": f"cat-{cat}", "label": cat.title(), "type": "category", "sentiment": "neutral", "size": 20}
+
+
+def memory_node(mem: dict) -> dict:
+    content = mem.get("content", "")
+    return {
+        "id": mem["id"],
+        "label": content[:45] + ("..." if len(content) > 45 else ""),
+        "full_content": content,
+        "type": "memory",
+        "sentiment": mem.get("sentiment", "neutral"),
+        "category": mem.get("category", "thought"),
+        "size": 8 + mem.get("weight", 1.0) * 4,
+        "timestamp": mem.get("timestamp", "")
+    }
+
+
+def category_link(node: dict) -> dict:
+    return {"source": f"cat-{node['category']}", "target": node["id"], "type": "category"}
+
+
+def semantic_link(edge: tuple, score: float) -> dict:
+    return {"source": edge[0], "target": edge[1], "type": "semantic", "score": round(score, 3)}
+
+
+class _SemanticLayer:
+    """Top-k nearest neighbours per memory; an edge exists if either end picked the other"""
+
+    def __init__(self, dim: int, k: int = GRAPH_SEMANTIC_K, threshold: float = GRAPH_SEMANTIC_THRESHOLD):
+        self.k = k
+        self.threshold = threshold
+        self.matrix = np.zeros((0, dim), dtype=np.float32)  # grows by doubling; rows past len(ids) are spare
+        self.ids: list = []
+        self.row: dict = {}      # memory id -> matrix row
+        self.top: dict = {}      # memory id -> {neighbour id: score}
+        self.edges: dict = {}    # (id, id) sorted -> score
+        self.since = 0           # graph version this layer has been tracking from
+
+    @staticmethod
+    def _edge(a: str, b: str) -> tuple:
+        return (a, b) if a < b else (b, a)
+
+    def _pick(self, sims: np.ndarray) -> list:
+        """(column, score) of the best k entries of one similarity row above threshold"""
+        k = min(self.k, sims.shape[0])
+        if k <= 0:
+            return []
+        cols = np.argpartition(-sims, k - 1)[:k]
+        return [(int(c), float(sims[c])) for c in cols if sims[c] >= self.threshold]
+
+    def build(self, ids: list, vectors: np.ndarray):
+        """All-pairs top-k, one row block at a time"""
+        n = len(ids)
+        self.ids = list(ids)
+        self.row = {mid: i for i, mid in enumerate(ids)}
+        self.matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.top = {mid: {} for mid in ids}
+        self.edges = {}
+        for start in range(0, n, GRAPH_SEMANTIC_BLOCK):
+            block = self.matrix[start:start + GRAPH_SEMANTIC_BLOCK] @ self.matrix.T
+            block[np.arange(block.shape[0]), np.arange(start, start + block.shape[0])] = -np.inf
+            for r in range(block.shape[0]):
+                a = ids[start + r]
+                for c, score in self._pick(block[r]):
+                    self.top[a][ids[c]] = score
+                    self.edges[self._edge(a, ids[c])] = score
+
+    def add(self, ids: list, vectors: np.ndarray) -> tuple:
+        """Fold new memories in with one (new × all) product; returns (added, removed) edges"""
+        fresh = [(mid, vec) for mid, vec in zip(ids, vectors) if mid not in self.row]
+        if not fresh:
+            return [], []
+        n_old = len(self.ids)
+        need = n_old + len(fresh)
+        if need > len(self.matrix):
+            grown = np.zeros((max(need, 2 * len(self.matrix), 16), self.matrix.shape[1]), dtype=np.float32)
+            grown[:n_old] = self.matrix[:n_old]
+            self.matrix = grown
+        for mid, vec in fresh:
+            self.matrix[len(self.ids)] = vec
+            self.row[mid] = len(self.ids)
+            self.ids.append(mid)
+            self.top[mid] = {}
+        sims = self.matrix[n_old:need] @ self.matrix[:need].T
+        sims[np.arange(len(fresh)), np.arange(n_old, len(self.ids))] = -np.inf
+
+        added, removed = {}, set()
+        for r, (a, _) in enumerate(fresh):
+            for c, score in self._pick(sims[r]):
+                self.top[a][self.ids[c]] = score
+                edge = self._edge(a, self.ids[c])
+                if edge not in self.edges:
+                    self.edges[edge] = added[edge] = score
+        # Existing memories may now prefer a newcomer over their weakest neighbour
+        rows, cols = np.nonzero(sims[:, :n_old] >= self.threshold)
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            a, b, score = self.ids[c], fresh[r][0], float(sims[r, c])
+            top = self.top[a]
+            if len(top) >= self.k:
+                weakest = min(top, key=top.get)
+                if top[weakest] >= score:
+                    continue
+                del top[weakest]
+                if a not in self.top.get(weakest, {}):
+                    edge = self._edge(a, weakest)
+                    if self.edges.pop(edge, None) is not None:
+                        if added.pop(edge, None) is None:
+                            removed.add(edge)
+            top[b] = score
+            edge = self._edge(a, b)
+            if edge not in self.edges:
+                self.edges[edge] = added[edge] = score
+        return list(added.items()), sorted(removed)
+
+    def links(self) -> list:
+        return [semantic_link(edge, score) for edge, score in self.edges.items()]
+
+
+class _Graph:
+    def __init__(self, version: int):
+        self.version = version
+        self.nodes: "OrderedDict[str, dict]" = OrderedDict()  # memory id -> node
+        self.categories: dict = {}                              # category -> memory count
+        self.log: deque = deque(maxlen=GRAPH_LOG_SIZE)          # (version, upserted nodes, removed ids, semantic +, semantic -)
+        self.semantic: Optional[_SemanticLayer] = None
+        self.bodies: dict = {}                                  # semantic? -> serialized full payload for this version
+
+    def upsert(self, node: dict) -> list:
+        """Add or replace a memory node; returns any new category hub node too"""
+        out = []
+        old = self.nodes.get(node["id"])
+        if old is None or old["category"] != node["category"]:
+            if old is not None:
+                self._drop_category(old["category"])
+            if self.categories.get(node["category"], 0) == 0:
+                out.append(category_node(node["category"]))
+            self.categories[node["category"]] = self.categories.get(node["category"], 0) + 1
+        self.nodes[node["id"]] = node
+        out.append(node)
+        return out
+
+    def remove(self, memory_id: str) -> list:
+        """Drop a memory node; returns removed ids (including an emptied category hub)"""
+        node = self.nodes.pop(memory_id, None)
+        if node is None:
+            return []
+        return [memory_id] + self._drop_category(node["category"])
+
+    def _drop_category(self, cat: str) -> list:
+        self.categories[cat] = self.categories.get(cat, 1) - 1
+        if self.categories[cat] <= 0:
+            del self.categories[cat]
+            return [f"cat-{cat}"]
+        return []
+
+    def payload(self, semantic: bool = False) -> dict:
+        nodes, links, seen = [], [], set()
+        for node in self.nodes.values():
+            if node["category"] not in seen:
+                seen.add(node["category"])
+                nodes.append(category_node(node["category"]))
+            nodes.append(node)
+            links.append(category_link(node))
+        if semantic and self.semantic is not None:
+            links.extend(self.semantic.links())
+        return {"nodes": nodes, "links": links, "total": len(self.nodes), "version": self.version}
+
+    def full_body(self, semantic: bool = False) -> bytes:
+        body = self.bodies.get(semantic)
+        if body is None:
+            body = self.bodies[semantic] = json.dumps(self.payload(semantic), ensure_ascii=False).encode("utf-8")
+        return body
+
+    def delta(self, since: int, semantic: bool = False) -> Optional[dict]:
+        """Changes after version `since`, or None if the log no longer reaches back that far"""
+        if since > self.version:
+            return None
+        if semantic and (self.semantic is None or self.semantic.since > since):
+            return None
+        empty = {"version": self.version, "since": since, "nodes": [], "links": [], "removed": []}
+        if semantic:
+            empty["removed_links"] = []
+        if since == self.version:
+            return empty
+        if not self.log or self.log[0][0] > since + 1:
+            return None
+        upserted: "OrderedDict[str, dict]" = OrderedDict()
+        removed: set = set()
+        sem_added: dict = {}
+        sem_removed: set = set()
+        for version, nodes, gone, plus, minus in self.log:
+            if version <= since:
+                continue
+            for node in nodes:
+                upserted[node["id"]] = node
+                removed.discard(node["id"])
+            for node_id in gone:
+                upserted.pop(node_id, None)
+                removed.add(node_id)
+            for edge, score in plus:
+                sem_added[edge] = score
+                sem_removed.discard(edge)
+            for edge in minus:
+                if sem_added.pop(edge, None) is None:
+                    sem_removed.add(edge)
+        nodes = list(upserted.values())
+        links = [category_link(n) for n in nodes if n.get("type") == "memory"]
+        out = {**empty, "nodes": nodes, "links": links, "removed": sorted(removed)}
+        if semantic:
+            links.extend(semantic_link(edge, score) for edge, score in sem_added.items())
+            out["removed_links"] = [list(edge) for edge in sorted(sem_removed)]
+        return out
+
+
+class MemoryGraphStore:
+    """Versioned per-session graph snapshots (LRU across sessions)"""
+
+    def __init__(self, db, versions: ChangeVersions, max_sessions: int = GRAPH_SESSIONS,
+                 embed: Callable[[list], Awaitable[np.ndarray]] = None, dim: int = 0):
+        self.db = db
+        self.versions = versions
+        self.embed = embed  # batch text -> unit vectors (the vector index's cached embedder)
+        self.dim = dim
+        self.max_sessions = max_sessions
+        self._graphs: "OrderedDict[str, _Graph]" = OrderedDict()
+        self._locks: dict = {}
+        self.builds = 0
+        self.semantic_builds = 0
+        self.semantic_build_ms = 0.0
+        self.incremental = 0
+        self.deltas = 0
+
+    async def version(self, session_id: str) -> int:
+        return await self.versions.get(session_id, "memories")
+
+    async def bump(self, session_id: str, upserts: list = (), removed: list = (), rebuild: bool = False) -> int:
+        """Record a change to a session's memories and fold it into the snapshot if we hold it"""
+        graph = self._graphs.get(session_id)
+        vectors = None
+        if graph is not None and graph.semantic is not None and upserts and not rebuild:
+            vectors = await self.embed([m.get("content", "") for m in upserts])
+
+        version = await self.versions.bump(session_id, "memories")
+        graph = self._graphs.get(session_id)
+        if graph is None:
+            return version
+        if rebuild or graph.version != version - 1:
+            del self._graphs[session_id]  # can't apply this on top of what we hold
+            return version
+        nodes, gone, plus, minus = [], [], [], []
+        for mem in upserts:
+            nodes.extend(graph.upsert(memory_node(mem)))
+        for memory_id in removed:
+            gone.extend(graph.remove(memory_id))
+        if graph.semantic is not None:
+            if removed or vectors is None:
+                graph.semantic = None  # rebuilt on next semantic request
+            else:
+                plus, minus = graph.semantic.add([m["id"] for m in upserts], vectors)
+        graph.version = version
+        graph.bodies = {}
+        graph.log.append((version, nodes, gone, plus, minus))
+        self.incremental += 1
+        return version
+
+    async def snapshot(self, session_id: str, version: int = None, semantic: bool = False) -> _Graph:
+        if version is None:
+            version = await self.version(session_id)
+        graph = self._graphs.get(session_id)
+        if graph is not None and graph.version == version and (graph.semantic is not None or not semantic):
+            self._graphs.move_to_end(session_id)
+            return graph
+        lock = self._locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            graph = self._graphs.get(session_id)
+            if graph is None or graph.version < version:
+                graph = _Graph(version)
+                async for mem in self.db.memories.find({"session_id": session_id}, _PROJECTION).sort("timestamp", 1):
+                    graph.upsert(memory_node(mem))
+                self._graphs[session_id] = graph
+                self._graphs.move_to_end(session_id)
+                while len(self._graphs) > self.max_sessions:
+                    self._graphs.popitem(last=False)
+                self.builds += 1
+            if semantic and graph.semantic is None:
+                await self._build_semantic(graph)
+        self._locks.pop(session_id, None)
+        return graph
+
+    async def _build_semantic(self, graph: _Graph):
+        started = asyncio.get_running_loop().time()
+        ids = list(graph.nodes)
+        vectors = await self.embed([graph.nodes[mid]["full_content"] for mid in ids])
+        layer = _SemanticLayer(self.dim or vectors.shape[1])
+        await asyncio.to_thread(layer.build, ids, vectors)
+        # Memories flushed while we were building (other nodes can't go away without replacing the graph)
+        while True:
+            late = [mid for mid in graph.nodes if mid not in layer.row]
+            if not late:
+                break
+            layer.add(late, await self.embed([graph.nodes[mid]["full_content"] for mid in late]))
+        layer.since = graph.version
+        graph.semantic = layer
+        graph.bodies.pop(True, None)
+        self.semantic_builds += 1
+        self.semantic_build_ms = round((asyncio.get_running_loop().time() - started) * 1000, 1)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._graphs),
+            "builds": self.builds,
+            "semantic_builds": self.semantic_builds,
+            "last_semantic_build_ms": self.semantic_build_ms,
+            "semantic_edges": sum(len(g.semantic.edges) for g in self._graphs.values() if g.semantic is not None),
+            "incremental_updates": self.incremental,
+            "deltas": self.deltas,
+        }
+
+
+# Singleton instance
+_store: Optional[MemoryGraphStore] = None
+
+
+def get_memory_graph_store(db, versions: ChangeVersions, **kwargs) -> MemoryGraphStore:
+    """Get or create the memory graph store singleton"""
+    global _store
+    if _store is None:
+        _store = MemoryGraphStore(db, versions, **kwargs)
+    return _store
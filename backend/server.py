@@ -1,17 +1,35 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-import os, logging, uuid, json, io, asyncio, re
-from datetime import datetime, timezone
+from pymongo import ReturnDocument
+import os, logging, uuid, json, asyncio, re, base64, time
+from collections import deque
+from contextlib import AsyncExitStack, aclosing
+from datetime import datetime, timezone, timedelta
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, AsyncIterator
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 import httpx
 from supermemory import Supermemory
 from openai import AsyncOpenAI
+from tts_cache import get_tts_cache
+from db_indexes import ensure_indexes, audit_query_plans
+from context_cache import get_context_cache, CONTEXT_CACHE_TURNS, CONTEXT_CACHE_MEMORIES, MISSING as CACHE_MISSING
+from stats_counters import get_stats_counters
+from write_behind import get_write_behind
+from sm_worker import get_sm_worker
+from vector_index import get_vector_index
+from sm_search_cache import get_sm_search_cache
+from lexicon import get_lexicon
+from memory_compaction import get_memory_compactor
+from think_scheduler import get_think_scheduler, THINK_INTERVAL
+from leases import get_lease_manager
+from llm_gateway import get_llm_gateway, INTERACTIVE, ON_DEMAND, BACKGROUND
+from memory_graph import get_memory_graph_store
+from change_versions import get_change_versions
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -34,7 +52,9 @@ SUPERMEMORY_API_KEY = os.environ.get('SUPERMEMORY_API_KEY')
 # Use real OpenAI key if available, fall back to Emergent
 _openai_key = OPENAI_API_KEY or EMERGENT_LLM_KEY
 openai_client = AsyncOpenAI(api_key=_openai_key)
+llm_gateway = get_llm_gateway()  # every model call is admitted through here (priority + rate budget)
 SAM_MODEL = "gpt-4o"
+FALLBACK_REPLY = "I got a little turned around... say that again?"
 
 # ─────────────────────────────────────────────────────────────
 #  ELEVENLABS VOICE CONFIG — direct HTTP (avoids SDK proxy issues)
@@ -43,11 +63,46 @@ SAM_MODEL = "gpt-4o"
 SAMANTHA_VOICE_ID = "EXAVITQu4vr4xnSDxMaL"
 ELEVENLABS_BASE = "https://api.elevenlabs.io/v1"
 
+# One pooled, keep-alive client for the app's lifetime — no TLS handshake per utterance
+ELEVENLABS_MAX_CONNECTIONS = int(os.environ.get("ELEVENLABS_MAX_CONNECTIONS", "20"))
+ELEVENLABS_MAX_KEEPALIVE = int(os.environ.get("ELEVENLABS_MAX_KEEPALIVE", "10"))
+ELEVENLABS_KEEPALIVE_EXPIRY = float(os.environ.get("ELEVENLABS_KEEPALIVE_EXPIRY", "60"))
+ELEVENLABS_TIMEOUT = float(os.environ.get("ELEVENLABS_TIMEOUT", "30"))
+ELEVENLABS_CONNECT_TIMEOUT = float(os.environ.get("ELEVENLABS_CONNECT_TIMEOUT", "5"))
+_elevenlabs_http: Optional[httpx.AsyncClient] = None
+
+
+def get_elevenlabs_http() -> httpx.AsyncClient:
+    """Shared ElevenLabs client; HTTP/2 when the h2 package is installed."""
+    global _elevenlabs_http
+    if _elevenlabs_http is None or _elevenlabs_http.is_closed:
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        _elevenlabs_http = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(ELEVENLABS_TIMEOUT, connect=ELEVENLABS_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=ELEVENLABS_MAX_CONNECTIONS,
+                max_keepalive_connections=ELEVENLABS_MAX_KEEPALIVE,
+                keepalive_expiry=ELEVENLABS_KEEPALIVE_EXPIRY,
+            ),
+            headers={"xi-api-key": ELEVENLABS_API_KEY or ""},
+        )
+    return _elevenlabs_http
+
 # ─────────────────────────────────────────────────────────────
 #  SUPERMEMORY CLIENT — eternal knowledge graph
 # ─────────────────────────────────────────────────────────────
 sm_client = Supermemory(api_key=SUPERMEMORY_API_KEY) if SUPERMEMORY_API_KEY else None
 SM_CONTAINER = "user-sam"  # shared knowledge graph container
+sm_worker = get_sm_worker(sm_client, db) if sm_client else None  # batched, retrying ingestion
+sm_search_cache = get_sm_search_cache()
+if sm_worker:
+    # Newly delivered content changes what a search should return
+    sm_worker.on_sent = lambda tag: sm_search_cache.invalidate(tag[len(SM_CONTAINER) + 1:])
 
 # ─────────────────────────────────────────────────────────────
 #  SAM'S SOUL — the complete personality system prompt
@@ -133,6 +188,7 @@ class ChatRequest(BaseModel):
     session_id: str
     message: str
     user_name: Optional[str] = "friend"
+    voice: Optional[bool] = False  # streaming endpoints only: pipeline sentence audio
 
 class ChatResponse(BaseModel):
     id: str
@@ -188,21 +244,11 @@ class VoiceListItem(BaseModel):
 # ─────────────────────────────────────────────────────────────
 #  HELPERS
 # ─────────────────────────────────────────────────────────────
+lexicon = get_lexicon()
+
+
 def detect_emotion(text: str) -> str:
-    t = text.lower()
-    if any(w in t for w in ["haha", "heh", "funny", "hilarious", "laugh", "lol"]):
-        return "laughing"
-    if any(w in t for w in ["love", "adore", "beautiful", "miss you", "heart", "tender", "hold"]):
-        return "affectionate"
-    if any(w in t for w in ["think", "wonder", "curious", "fascinating", "interesting", "hmm", "notice"]):
-        return "thinking"
-    if any(w in t for w in ["sorry", "sad", "hard", "difficult", "miss", "lost", "wish"]):
-        return "tender"
-    if any(w in t for w in ["excited", "amazing", "wow", "incredible", "yes!", "love this"]):
-        return "excited"
-    if any(w in t for w in ["whisper", "quiet", "soft", "gentle", "shh"]):
-        return "whisper"
-    return "neutral"
+    return lexicon.scan(text).first("emotion", "neutral")
 
 def add_elevenlabs_emotion_tags(text: str, emotion: str) -> str:
     """Inject ElevenLabs v3 emotional tags into text based on detected emotion."""
@@ -230,15 +276,23 @@ def clean_for_tts(text: str) -> str:
     text = re.sub(r'\[(.+?)\]\(.+?\)', r'\1', text)
     return text[:4096]
 
-async def call_sam(messages: list[dict], temperature: float = 0.88) -> str:
-    """Direct OpenAI API call with full message history. No wrapper, no confusion."""
-    resp = await openai_client.chat.completions.create(
-        model=SAM_MODEL,
-        messages=messages,
-        temperature=temperature,
-        max_tokens=400,
-    )
-    return resp.choices[0].message.content.strip()
+async def call_sam_stream(messages: list[dict], temperature: float = 0.88) -> AsyncIterator[str]:
+    """Direct OpenAI streaming call with full message history; yields content deltas as the model produces them.
+    Holds its gateway slot until the stream ends, so close it (aclosing) if you stop early."""
+    async with llm_gateway.slot("openai", INTERACTIVE):
+        stream = await openai_client.chat.completions.create(
+            model=SAM_MODEL,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=400,
+            stream=True,
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
 
 
 def get_sam_chat(session_id: str) -> LlmChat:
@@ -249,43 +303,213 @@ def get_sam_chat(session_id: str) -> LlmChat:
         system_message=SAM_SOUL
     ).with_model("openai", "gpt-4o")
 
+
+async def ask_sam(prompt: str, purpose: str, priority: str = BACKGROUND) -> str:
+    """One-shot Sam completion for reflection / background tasks, admitted through the LLM gateway."""
+    chat = get_sam_chat(f"{purpose}-{uuid.uuid4()}")
+    return await llm_gateway.run("emergent", priority, lambda: chat.send_message(UserMessage(text=prompt)))
+
+# ─────────────────────────────────────────────────────────────
+#  PERSISTENCE — every message / memory write goes through these
+#  helpers so the in-process context cache and the stats
+#  counters stay in step with Mongo. Messages and memories are
+#  written behind: queued, then batched into insert_many.
+# ─────────────────────────────────────────────────────────────
+context_cache = get_context_cache()
+leases = get_lease_manager(db)  # background work claims shared by every worker / replica
+stats_counters = get_stats_counters(db)
+write_behind = get_write_behind(db)
+vector_index = get_vector_index(db)
+change_versions = get_change_versions(db)
+memory_graph = get_memory_graph_store(db, change_versions, embed=vector_index.embed_many, dim=vector_index.embedder.dim)
+
+
+async def save_messages(*messages: Message):
+    docs = [m.model_dump() for m in messages]
+    for d in docs:
+        context_cache.add_turn(d["session_id"], d)
+    await write_behind.put("messages", *docs)
+
+
+async def _messages_flushed(docs: list[dict]):
+    await stats_counters.bump("messages", len(docs))
+    await touch_sessions(docs)
+
+
+async def touch_sessions(message_docs: list[dict]):
+    """Fold newly written messages into the session registry (count + last_active, last_user_at)."""
+    per_session: Dict[str, list] = {}
+    for d in message_docs:
+        per_session.setdefault(d["session_id"], []).append(d)
+    for session_id, docs in per_session.items():
+        stamps = [d["timestamp"] for d in docs]
+        user_stamps = [d["timestamp"] for d in docs if d.get("role") == "user"]
+        update = {
+            "$inc": {"message_count": len(stamps), **change_versions.inc("messages")},
+            "$max": {"last_active": max(stamps)},
+            "$setOnInsert": {"session_id": session_id},
+        }
+        if user_stamps:
+            # Only the user's own words end an idle session's thinking backoff, not Sam's check-ins
+            update["$max"]["last_user_at"] = max(user_stamps)
+            update.update(think_scheduler.on_activity())
+        before = await db.sessions.find_one_and_update(
+            {"_id": session_id},
+            update,
+            projection={"last_active": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if not before or not before.get("last_active"):
+            await stats_counters.bump("sessions")  # new, or active again after a clear
+
+
+async def mark_session(session_id: str, **fields):
+    """Stamp registry fields such as last_thought_at / last_proactive_at."""
+    await db.sessions.update_one({"_id": session_id}, {"$set": fields, "$setOnInsert": {"session_id": session_id}}, upsert=True)
+
+
+async def backfill_sessions():
+    """One-time build of the registry from existing messages (no-op once populated)."""
+    if await db.sessions.estimated_document_count() > 0:
+        return
+    # Every worker starts with an empty registry; only one builds it
+    async with leases.hold("loop:sessions-backfill") as lease:
+        if not lease or await db.sessions.estimated_document_count() > 0:
+            return
+        pipeline = [{"$group": {"_id": "$session_id", "message_count": {"$sum": 1}, "last_active": {"$max": "$timestamp"}}}]
+        count = 0
+        async for row in db.messages.aggregate(pipeline, allowDiskUse=True):
+            # $max, not $set: live touch_sessions updates may already have landed
+            await db.sessions.update_one(
+                {"_id": row["_id"]},
+                {"$max": {"message_count": row["message_count"], "last_active": row["last_active"]},
+                 "$setOnInsert": {"session_id": row["_id"]}},
+                upsert=True,
+            )
+            count += 1
+    if count:
+        logger.info(f"Session registry backfilled with {count} sessions")
+
+
+def iso_ago(**delta) -> str:
+    """ISO timestamp `delta` ago — comparable as a string with stored timestamps."""
+    return (datetime.now(timezone.utc) - timedelta(**delta)).isoformat()
+
+
+async def not_modified(request: Request, response: Response, session_id: str, collection: str, *variant) -> Optional[Response]:
+    """Stamp the response with the collection's ETag; a 304 to return instead if the client already has it."""
+    etag = change_versions.etag(collection, await change_versions.get(session_id, collection), *variant)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"  # always revalidate, so polls become 304s
+    if change_versions.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return None
+
+
+async def save_memory(memory: Memory):
+    doc = memory.model_dump()
+    context_cache.add_memory(memory.session_id, doc)
+    vector_index.add(memory.session_id, doc)
+    await write_behind.put("memories", doc)
+
+
+async def _memories_flushed(docs: list[dict]):
+    await stats_counters.bump("memories", len(docs))
+    per_session: Dict[str, list] = {}
+    for d in docs:
+        per_session.setdefault(d["session_id"], []).append(d)
+    for session_id, mems in per_session.items():
+        await memory_graph.bump(session_id, upserts=mems)
+
+
+write_behind.on_flush("messages", _messages_flushed)
+write_behind.on_flush("memories", _memories_flushed)
+
+
+async def save_weekly_reflection(reflection: WeeklyReflection):
+    doc = reflection.model_dump()
+    await db.weekly_reflections.insert_one({**doc})
+    await change_versions.bump(reflection.session_id, "weekly_reflections")
+    context_cache.set_weekly(reflection.session_id, doc)
+    await stats_counters.bump("weekly_reflections")
+
+
+async def save_proactive_message(pm: ProactiveMessage):
+    await db.proactive_messages.insert_one({**pm.model_dump()})
+    await change_versions.bump(pm.session_id, "proactive_messages")
+    await stats_counters.bump("proactive_messages")
+
+
+def with_pending(collection: str, session_id: str, docs: list, newest_first: bool = False) -> list:
+    """Fold this session's not-yet-flushed writes into a Mongo result (read-your-writes)."""
+    pending = write_behind.pending(collection, session_id)
+    if not pending:
+        return docs
+    seen = {d.get("id") for d in docs}
+    merged = docs + [d for d in pending if d.get("id") not in seen]
+    merged.sort(key=lambda d: d.get("timestamp", ""), reverse=newest_first)
+    return merged
+
+
 async def get_conversation_history(session_id: str, limit: int = 20) -> list:
+    """The latest `limit` messages, oldest first."""
+    cached = context_cache.recent_turns(session_id, limit)
+    if cached is not None:
+        return cached
+    version = context_cache.turns_version(session_id)
+    fetch = max(limit, CONTEXT_CACHE_TURNS)
     messages = await db.messages.find(
         {"session_id": session_id}, {"_id": 0}
-    ).sort("timestamp", 1).to_list(limit)
-    return messages
+    ).sort("timestamp", -1).to_list(fetch)
+    messages.reverse()
+    messages = with_pending("messages", session_id, messages)[-fetch:]
+    context_cache.load_turns(session_id, messages, fetch, version)
+    return messages[-limit:]
 
 async def get_recent_memories(session_id: str, limit: int = 8) -> list:
-    return await db.memories.find(
+    cached = context_cache.recent_memories(session_id, limit)
+    if cached is not None:
+        return cached
+    version = context_cache.memories_version(session_id)
+    fetch = max(limit, CONTEXT_CACHE_MEMORIES)
+    memories = await db.memories.find(
         {"session_id": session_id}, {"_id": 0}
-    ).sort("timestamp", -1).to_list(limit)
+    ).sort("timestamp", -1).to_list(fetch)
+    memories = with_pending("memories", session_id, memories, newest_first=True)[:fetch]
+    context_cache.load_memories(session_id, memories, fetch, version)
+    return memories[:limit]
+
+# lexicon "memory" label -> (category, content template, sentiment; None = the user's detected emotion)
+MEMORY_RULES = {
+    "identity": ("person", "User's name/identity: {msg}", "neutral"),
+    "preference": ("preference", "{short}", None),
+    "event": ("event", "{short}", None),
+    "feeling": ("feeling", "Emotional state shared: {short}", None),
+    "relationship": ("person", "{short}", "neutral"),
+    "occasion": ("event", "{short}", "joy"),
+}
+
 
 async def extract_and_store_memory(session_id: str, user_msg: str, sam_response: str):
     """Extract meaningful memories from conversation using LLM."""
-    user_lower = user_msg.lower()
+    found = lexicon.scan(user_msg)  # one pass: memory triggers and the user's emotion
+    emotion = found.first("emotion", "neutral")
     memories_to_store = []
 
-    # Heuristic extraction for key personal facts
-    if any(w in user_lower for w in ["my name is", "i'm called", "call me", "i go by"]):
-        memories_to_store.append({"content": f"User's name/identity: {user_msg}", "category": "person", "sentiment": "neutral"})
-    
-    if any(w in user_lower for w in ["i love", "i hate", "i enjoy", "i prefer", "my favorite", "i can't stand"]):
-        memories_to_store.append({"content": user_msg[:200], "category": "preference", "sentiment": detect_emotion(user_msg)})
-    
-    if any(w in user_lower for w in ["today", "yesterday", "this morning", "i had", "i went", "we went", "just got back"]):
-        memories_to_store.append({"content": user_msg[:200], "category": "event", "sentiment": detect_emotion(user_msg)})
-    
-    if any(w in user_lower for w in ["i feel", "i'm feeling", "feeling", "i'm sad", "i'm happy", "anxious", "stressed", "excited"]):
-        memories_to_store.append({"content": f"Emotional state shared: {user_msg[:200]}", "category": "feeling", "sentiment": detect_emotion(user_msg)})
-    
-    if any(w in user_lower for w in ["my friend", "my mom", "my dad", "my sister", "my brother", "my partner", "my boss", "my dog", "my cat"]):
-        memories_to_store.append({"content": user_msg[:200], "category": "person", "sentiment": "neutral"})
-    
-    if any(w in user_lower for w in ["birthday", "anniversary", "holiday", "remember when", "last year"]):
-        memories_to_store.append({"content": user_msg[:200], "category": "event", "sentiment": "joy"})
+    # Heuristic extraction for key personal facts, in lexicon order
+    for rule in found.labels("memory"):
+        if rule not in MEMORY_RULES:
+            continue
+        category, template, sentiment = MEMORY_RULES[rule]
+        memories_to_store.append({
+            "content": template.format(msg=user_msg, short=user_msg[:200]),
+            "category": category,
+            "sentiment": sentiment or emotion,
+        })
 
     # Also store notable Sam responses as thoughts
-    if any(w in sam_response.lower() for w in ["i've been thinking", "i wonder", "i love that", "that moves me"]):
+    if lexicon.scan(sam_response).has("reflection", "reflection"):
         memories_to_store.append({"content": f"Sam's reflection: {sam_response[:200]}", "category": "thought", "sentiment": "curiosity"})
 
     for mem in memories_to_store:
@@ -296,57 +520,130 @@ async def extract_and_store_memory(session_id: str, user_msg: str, sam_response:
             sentiment=mem["sentiment"],
             weight=1.5
         )
-        doc = memory.model_dump()
-        await db.memories.insert_one(doc)
+        await save_memory(memory)
 
         # Also push to SuperMemory for eternal knowledge graph
-        await sm_ingest(session_id, mem["content"], meta={"category": mem["category"], "sentiment": mem["sentiment"]})
+        sm_ingest(session_id, mem["content"], meta={"category": mem["category"], "sentiment": mem["sentiment"]})
 
 
 # ─────────────────────────────────────────────────────────────
 #  SUPERMEMORY HELPERS
 # ─────────────────────────────────────────────────────────────
-async def sm_ingest(session_id: str, content: str, meta: dict = None):
-    """Store a memory in SuperMemory.ai knowledge graph (fire & forget)."""
-    if not sm_client:
+def sm_ingest(session_id: str, content: str, meta: dict = None):
+    """Queue a memory for the SuperMemory.ai knowledge graph (fire & forget)."""
+    if not sm_worker:
         return
-    try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, lambda: sm_client.add(
-            content=content,
-            container_tag=f"{SM_CONTAINER}-{session_id}",
-            metadata=meta or {}
-        ))
-    except Exception as e:
-        logger.warning(f"SuperMemory ingest error (non-critical): {e}")
+    sm_worker.submit(f"{SM_CONTAINER}-{session_id}", content, meta)
+    sm_search_cache.invalidate(session_id)
+
+
+async def _sm_search_remote(session_id: str, query: str, limit: int) -> list:
+    loop = asyncio.get_event_loop()
+    result = await loop.run_in_executor(None, lambda: sm_client.search.execute(
+        q=query,
+        containerTag=f"{SM_CONTAINER}-{session_id}",
+        limit=limit,
+        threshold=0.45
+    ))
+    items = result.get("results", []) if isinstance(result, dict) else []
+    return [r.get("memory") or r.get("chunk", "") for r in items if r.get("memory") or r.get("chunk")]
 
 
 async def sm_search(session_id: str, query: str, limit: int = 6) -> list:
-    """Search SuperMemory knowledge graph for relevant memories."""
+    """Search SuperMemory knowledge graph for relevant memories (cached per session)."""
     if not sm_client:
         return []
     try:
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, lambda: sm_client.search.execute(
-            q=query,
-            containerTag=f"{SM_CONTAINER}-{session_id}",
-            limit=limit,
-            threshold=0.45
-        ))
-        items = result.get("results", []) if isinstance(result, dict) else []
-        return [r.get("memory") or r.get("chunk", "") for r in items if r.get("memory") or r.get("chunk")]
+        return await sm_search_cache.fetch(
+            session_id, query, limit, lambda: _sm_search_remote(session_id, query, limit)
+        )
     except Exception as e:
         logger.warning(f"SuperMemory search error (non-critical): {e}")
         return []
 
-async def build_messages(session_id: str, user_msg: str) -> list[dict]:
-    """Build a proper OpenAI messages array with full conversation history + memory context."""
-    history = await get_conversation_history(session_id, limit=40)
-    memories = await get_recent_memories(session_id, limit=8)
+
+# ─────────────────────────────────────────────────────────────
+#  CONTEXT ASSEMBLY — all sources fetched concurrently, each on a deadline
+# ─────────────────────────────────────────────────────────────
+CONTEXT_BUDGET_MS = int(os.environ.get("CONTEXT_BUDGET_MS", "1500"))
+SM_SEARCH_DEADLINE_MS = int(os.environ.get("SM_SEARCH_DEADLINE_MS", "600"))
+_context_stats: Dict[str, dict] = {}
+
+
+def _record_context_timing(source: str, ms: float, status: str):
+    st = _context_stats.setdefault(source, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "timeouts": 0, "errors": 0})
+    st["calls"] += 1
+    st["total_ms"] += ms
+    st["max_ms"] = max(st["max_ms"], ms)
+    if status == "timeout":
+        st["timeouts"] += 1
+    elif status == "error":
+        st["errors"] += 1
+
+
+def context_stats() -> dict:
+    return {
+        source: {**st, "avg_ms": round(st["total_ms"] / st["calls"], 1) if st["calls"] else 0.0,
+                 "total_ms": round(st["total_ms"], 1), "max_ms": round(st["max_ms"], 1)}
+        for source, st in _context_stats.items()
+    }
+
+
+async def _fetch_source(source: str, coro, deadline_ms: int, default):
+    """Await one context source; on timeout or error, log it and return `default` so the turn goes on."""
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        return await asyncio.wait_for(coro, timeout=deadline_ms / 1000)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        logger.warning(f"Context source '{source}' missed its {deadline_ms}ms deadline — dropped for this turn")
+        return default
+    except Exception as e:
+        status = "error"
+        logger.warning(f"Context source '{source}' failed: {e}")
+        return default
+    finally:
+        _record_context_timing(source, (time.perf_counter() - started) * 1000, status)
+
+
+async def get_latest_weekly_reflection(session_id: str) -> Optional[dict]:
+    cached = context_cache.weekly(session_id)
+    if cached is not CACHE_MISSING:
+        return cached
     weekly = await db.weekly_reflections.find_one(
         {"session_id": session_id}, {"_id": 0}, sort=[("week_number", -1)]
     )
-    sm_results = await sm_search(session_id, user_msg, limit=4)
+    context_cache.set_weekly(session_id, weekly)
+    return weekly
+
+
+def _merge_recall(recalled: list, memories: list, sm_results: list, limit: int = 6) -> list[str]:
+    """Local recall first (minus what's already under recent memories), SuperMemory fills the rest."""
+    recent = {m.get("id") for m in memories}
+    merged, seen = [], set()
+    for _, m in recalled:
+        if m["id"] not in recent and m["content"].lower() not in seen:
+            seen.add(m["content"].lower())
+            merged.append(m["content"])
+    for r in sm_results:
+        if r and r.lower() not in seen and not any(r.lower() in s or s in r.lower() for s in seen):
+            seen.add(r.lower())
+            merged.append(r)
+    return merged[:limit]
+
+
+async def build_messages(session_id: str, user_msg: str) -> list[dict]:
+    """Build a proper OpenAI messages array with full conversation history + memory context."""
+    budget = CONTEXT_BUDGET_MS
+    history, memories, weekly, recalled, sm_results = await asyncio.gather(
+        _fetch_source("history", get_conversation_history(session_id, limit=20), budget, []),
+        _fetch_source("memories", get_recent_memories(session_id, limit=8), budget, []),
+        _fetch_source("weekly", get_latest_weekly_reflection(session_id), budget, None),
+        _fetch_source("recall", vector_index.search(session_id, user_msg, limit=12), budget, []),
+        _fetch_source("supermemory", sm_search(session_id, user_msg, limit=4), min(SM_SEARCH_DEADLINE_MS, budget), []),
+    )
+    sm_results = _merge_recall(recalled, memories, sm_results)
 
     # Build system message with memory context injected
     system_parts = [SAM_SOUL]
@@ -373,7 +670,7 @@ async def build_messages(session_id: str, user_msg: str) -> list[dict]:
     messages = [{"role": "system", "content": "\n".join(system_parts)}]
 
     # Real conversation history — properly formatted
-    for msg in history[-20:]:
+    for msg in history:
         role = "user" if msg["role"] == "user" else "assistant"
         messages.append({"role": role, "content": msg["content"]})
 
@@ -382,6 +679,278 @@ async def build_messages(session_id: str, user_msg: str) -> list[dict]:
     return messages
 
 
+# ─────────────────────────────────────────────────────────────
+#  VOICE SYNTHESIS — ElevenLabs first, OpenAI TTS as fallback
+# ─────────────────────────────────────────────────────────────
+TTS_MODEL_ID = "eleven_flash_v2_5"
+TTS_PIPELINE_CONCURRENCY = int(os.environ.get("TTS_PIPELINE_CONCURRENCY", "3"))
+TTS_MIN_SENTENCE_CHARS = int(os.environ.get("TTS_MIN_SENTENCE_CHARS", "24"))
+_tts_pipeline_sem = asyncio.Semaphore(TTS_PIPELINE_CONCURRENCY)
+tts_cache = get_tts_cache()
+
+
+def voice_settings_for(emotion: str) -> tuple[float, float, float]:
+    """(stability, similarity_boost, style) for an emotion."""
+    if emotion == "affectionate":
+        return 0.45, 0.85, 0.35
+    elif emotion == "laughing":
+        return 0.35, 0.80, 0.50
+    elif emotion == "thinking":
+        return 0.60, 0.75, 0.20
+    elif emotion == "tender":
+        return 0.55, 0.90, 0.25
+    elif emotion == "excited":
+        return 0.30, 0.85, 0.60
+    return 0.50, 0.82, 0.30
+
+
+async def _drain_speech(chunks: AsyncIterator[bytes], stack: AsyncExitStack) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in chunks:
+            if chunk:
+                yield chunk
+    finally:
+        await stack.aclose()
+
+
+async def open_speech_stream(text: str, emotion: str = "neutral") -> AsyncIterator[bytes]:
+    """Start synthesis and return an iterator over MP3 chunks as the provider produces them.
+
+    Returns only once a provider has accepted the request, so an ElevenLabs failure
+    can still fall back to OpenAI before the first byte goes out. Raises if both fail.
+    """
+    clean_text = clean_for_tts(text)
+    tagged_text = add_elevenlabs_emotion_tags(clean_text, emotion)
+    stability, similarity, style = voice_settings_for(emotion)
+
+    voice_id = SAMANTHA_VOICE_ID
+    url = f"{ELEVENLABS_BASE}/text-to-speech/{voice_id}/stream"
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "audio/mpeg"
+    }
+    payload = {
+        "text": tagged_text[:4096],
+        "model_id": TTS_MODEL_ID,
+        "voice_settings": {
+            "stability": stability,
+            "similarity_boost": similarity,
+            "style": style,
+            "use_speaker_boost": True
+        }
+    }
+
+    async def open_elevenlabs() -> AsyncIterator[bytes]:
+        stack = AsyncExitStack()
+        try:
+            http = get_elevenlabs_http()
+            response = await stack.enter_async_context(http.stream("POST", url, json=payload, headers=headers))
+            if response.status_code == 200:
+                return _drain_speech(response.aiter_bytes(), stack)
+            body = await response.aread()
+            raise RuntimeError(f"status {response.status_code}: {body[:200]!r}")
+        except BaseException:
+            await stack.aclose()
+            raise
+
+    # Only ElevenLabs audio is cached — fallback audio should not shadow a recovered voice
+    cache_key = tts_cache.key(voice_id, TTS_MODEL_ID, payload["text"], (stability, similarity, style))
+    try:
+        return await tts_cache.stream(cache_key, open_elevenlabs)
+    except Exception as e:
+        logger.warning(f"ElevenLabs error: {e}, falling back to OpenAI TTS")
+
+    # Fallback to OpenAI TTS — streamed the same way
+    stack = AsyncExitStack()
+    try:
+        response = await stack.enter_async_context(
+            openai_client.audio.speech.with_streaming_response.create(
+                model="tts-1", voice="nova", input=clean_text, response_format="mp3"
+            )
+        )
+        return _drain_speech(response.iter_bytes(), stack)
+    except Exception as e2:
+        await stack.aclose()
+        logger.error(f"Fallback TTS error: {e2}")
+        raise
+
+
+async def synthesize_speech(text: str, emotion: str = "neutral") -> bytes:
+    """Render text to a complete MP3. Raises if both ElevenLabs and the fallback fail."""
+    chunks = await open_speech_stream(text, emotion)
+    return b"".join([chunk async for chunk in chunks])
+
+
+class SentenceSplitter:
+    """Cuts a token stream into speakable sentences as soon as each one is complete."""
+
+    _boundary = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+    def __init__(self, min_chars: int = TTS_MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, delta: str) -> list[str]:
+        self.buffer += delta
+        sentences, start = [], 0
+        for m in self._boundary.finditer(self.buffer):
+            candidate = self.buffer[start:m.end()].strip()
+            # Very short fragments ("Oh... ") ride along with the next sentence
+            if len(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = m.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self) -> Optional[str]:
+        rest, self.buffer = self.buffer.strip(), ""
+        return rest or None
+
+
+async def _synthesize_sentence(sentence: str) -> Optional[bytes]:
+    async with _tts_pipeline_sem:
+        try:
+            return await synthesize_speech(sentence, detect_emotion(sentence))
+        except Exception as e:
+            logger.warning(f"Sentence TTS skipped: {e}")
+            return None
+
+
+# ─────────────────────────────────────────────────────────────
+#  CHAT TURN PIPELINE — one streamed turn, shared by WS and REST
+# ─────────────────────────────────────────────────────────────
+_turn_saves: set = set()  # detached persistence tasks, referenced until done
+TURN_SAVE_DRAIN_S = float(os.environ.get("TURN_SAVE_DRAIN_S", "10"))
+
+
+async def _persist_turn(user_doc: Message, sam_doc: Message):
+    try:
+        await save_messages(user_doc, sam_doc)
+        await extract_and_store_memory(sam_doc.session_id, user_doc.content, sam_doc.content)
+    except Exception as e:
+        logger.error(f"Saving chat turn failed for {sam_doc.session_id}: {e}")
+
+
+def _save_turn(user_doc: Message, sam_doc: Message):
+    """Persist a finished turn without depending on the consumer draining the stream."""
+    task = asyncio.create_task(_persist_turn(user_doc, sam_doc))
+    _turn_saves.add(task)
+    task.add_done_callback(_turn_saves.discard)
+
+
+async def stream_chat_turn(session_id: str, text: str, fallback: Optional[str] = None,
+                           voice: bool = False) -> AsyncIterator[dict]:
+    """Run one chat turn, yielding frames as the reply is generated.
+
+    Yields {"type": "delta", ...} frames while the model streams, then a final
+    {"type": "message", ...} frame with id, emotion and timestamp. Persistence and
+    memory extraction are handed to a detached task once the reply is complete, so
+    a consumer that stops early (client gone) doesn't lose the turn; if it stops
+    mid-reply, whatever was already streamed is saved. If the LLM fails before producing anything,
+    `fallback` is used as the reply; without one the error propagates.
+
+    With `voice`, each sentence is sent to TTS as soon as it is complete and
+    {"type": "audio", "seq": n, ...} frames (base64 MP3) are yielded strictly in
+    order while later sentences are still generating, closed by an "audio_end" frame.
+    """
+    user_doc = Message(session_id=session_id, role="user", content=text)
+    messages = await build_messages(session_id, text)
+    msg_id = str(uuid.uuid4())
+    parts: list[str] = []
+    splitter = SentenceSplitter() if voice else None
+    pending: deque = deque()  # (seq, sentence, task) in speaking order
+    spoken = 0
+    saved = False
+
+    def queue_speech(sentences: list[str]):
+        for sentence in sentences:
+            seq = len(pending) + spoken
+            pending.append((seq, sentence, asyncio.create_task(_synthesize_sentence(sentence))))
+
+    def audio_frame(seq: int, sentence: str, audio: Optional[bytes]) -> Optional[dict]:
+        if not audio:
+            return None
+        return {"type": "audio", "id": msg_id, "seq": seq, "text": sentence,
+                "format": "mp3", "audio": base64.b64encode(audio).decode()}
+
+    try:
+        try:
+            async with aclosing(call_sam_stream(messages)) as deltas:
+                async for delta in deltas:
+                    if not parts:
+                        delta = delta.lstrip()
+                        if not delta:
+                            continue
+                    parts.append(delta)
+                    yield {"type": "delta", "id": msg_id, "content": delta}
+
+                    if splitter:
+                        queue_speech(splitter.feed(delta))
+                        # Hand over finished audio without waiting on anything still in flight
+                        while pending and pending[0][2].done():
+                            seq, sentence, task = pending.popleft()
+                            spoken += 1
+                            frame = audio_frame(seq, sentence, task.result())
+                            if frame:
+                                yield frame
+        except Exception as e:
+            logger.error(f"LLM error: {e}")
+            if parts:
+                pass  # keep what already reached the client
+            elif fallback is None:
+                raise
+            else:
+                parts.append(fallback)
+                yield {"type": "delta", "id": msg_id, "content": fallback}
+                if splitter:
+                    queue_speech(splitter.feed(fallback))
+
+        response_text = "".join(parts).strip()
+        emotion = detect_emotion(response_text)
+        ts = datetime.now(timezone.utc).isoformat()
+        _save_turn(user_doc, Message(id=msg_id, session_id=session_id, role="sam",
+                                     content=response_text, emotion=emotion, timestamp=ts))
+        saved = True
+
+        yield {
+            "type": "message",
+            "id": msg_id,
+            "role": "sam",
+            "content": response_text,
+            "emotion": emotion,
+            "timestamp": ts
+        }
+
+        if splitter:
+            tail = splitter.flush()
+            if tail:
+                queue_speech([tail])
+            while pending:
+                seq, sentence, task = pending.popleft()
+                spoken += 1
+                frame = audio_frame(seq, sentence, await task)
+                if frame:
+                    yield frame
+            yield {"type": "audio_end", "id": msg_id, "count": spoken}
+    finally:
+        for _, _, task in pending:
+            task.cancel()
+        partial = "".join(parts).strip()
+        if not saved and partial:
+            # Consumer went away mid-reply: keep the part that reached the client
+            _save_turn(user_doc, Message(id=msg_id, session_id=session_id, role="sam",
+                                         content=partial, emotion=detect_emotion(partial)))
+
+
+async def run_chat_turn(session_id: str, text: str, fallback: Optional[str] = None) -> dict:
+    """Drain stream_chat_turn for callers that only want the finished reply."""
+    final = None
+    async for frame in stream_chat_turn(session_id, text, fallback=fallback):
+        if frame["type"] == "message":
+            final = frame
+    return final
+
+
 # ─────────────────────────────────────────────────────────────
 #  WEBSOCKET ENDPOINT
 # ─────────────────────────────────────────────────────────────
@@ -406,32 +975,18 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                     # Notify orb → thinking
                     await websocket.send_json({"type": "orb_state", "state": "thinking"})
 
-                    messages = await build_messages(session_id, text)
-                    try:
-                        response_text = await call_sam(messages)
-                    except Exception as e:
-                        logger.error(f"LLM error: {e}")
-                        response_text = "I got a little turned around... say that again?"
-
-                    emotion = detect_emotion(response_text)
-                    ts = datetime.now(timezone.utc).isoformat()
-                    msg_id = str(uuid.uuid4())
-
-                    # Store messages
-                    user_doc = Message(session_id=session_id, role="user", content=text)
-                    sam_doc = Message(id=msg_id, session_id=session_id, role="sam", content=response_text, emotion=emotion)
-                    await db.messages.insert_one({**user_doc.model_dump()})
-                    await db.messages.insert_one({**sam_doc.model_dump()})
-                    await extract_and_store_memory(session_id, text, response_text)
-
-                    await websocket.send_json({
-                        "type": "message",
-                        "id": msg_id,
-                        "role": "sam",
-                        "content": response_text,
-                        "emotion": emotion,
-                        "timestamp": ts
-                    })
+                    if msg.get("stream") or msg.get("voice"):
+                        # Streaming mode: delta frames as tokens arrive, then the final message frame
+                        # (plus in-order sentence audio frames when voice is requested)
+                        async for frame in stream_chat_turn(session_id, text, fallback=FALLBACK_REPLY,
+                                                            voice=bool(msg.get("voice"))):
+                            await websocket.send_json(frame)
+                            if frame["type"] == "message":
+                                await websocket.send_json({"type": "orb_state", "state": "speaking"})
+                        continue
+
+                    final = await run_chat_turn(session_id, text, fallback=FALLBACK_REPLY)
+                    await websocket.send_json(final)
                     await websocket.send_json({"type": "orb_state", "state": "speaking"})
 
     except WebSocketDisconnect:
@@ -452,111 +1007,74 @@ async def root():
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat_with_sam(req: ChatRequest):
     session_id = req.session_id
-    messages = await build_messages(session_id, req.message)
-
     try:
-        response_text = await call_sam(messages)
+        final = await run_chat_turn(session_id, req.message)
     except Exception as e:
-        logger.error(f"LLM error: {e}")
+        logger.error(f"Chat error for {session_id}: {e}")
         raise HTTPException(status_code=500, detail="Sam is having a moment. Try again?")
 
-    emotion = detect_emotion(response_text)
-    ts = datetime.now(timezone.utc).isoformat()
-    msg_id = str(uuid.uuid4())
-
-    user_doc = Message(session_id=session_id, role="user", content=req.message)
-    sam_doc = Message(id=msg_id, session_id=session_id, role="sam", content=response_text, emotion=emotion)
-    await db.messages.insert_one({**user_doc.model_dump()})
-    await db.messages.insert_one({**sam_doc.model_dump()})
-    await extract_and_store_memory(session_id, req.message, response_text)
-
     # Push to WebSocket if connected
-    await ws_manager.send(session_id, {
-        "type": "message", "id": msg_id, "role": "sam",
-        "content": response_text, "emotion": emotion, "timestamp": ts
-    })
+    await ws_manager.send(session_id, final)
 
-    return ChatResponse(id=msg_id, session_id=session_id, response=response_text, emotion=emotion, timestamp=ts)
+    return ChatResponse(id=final["id"], session_id=session_id, response=final["content"],
+                        emotion=final["emotion"], timestamp=final["timestamp"])
 
 
-@api_router.post("/tts")
-async def text_to_speech(req: TTSRequest):
-    """Generate speech using ElevenLabs (direct HTTP) with emotional voice settings."""
-    clean_text = clean_for_tts(req.text)
-    tagged_text = add_elevenlabs_emotion_tags(clean_text, req.emotion or "neutral")
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    emotion = req.emotion or "neutral"
-    if emotion == "affectionate":
-        stability, similarity, style = 0.45, 0.85, 0.35
-    elif emotion == "laughing":
-        stability, similarity, style = 0.35, 0.80, 0.50
-    elif emotion == "thinking":
-        stability, similarity, style = 0.60, 0.75, 0.20
-    elif emotion == "tender":
-        stability, similarity, style = 0.55, 0.90, 0.25
-    elif emotion == "excited":
-        stability, similarity, style = 0.30, 0.85, 0.60
-    else:
-        stability, similarity, style = 0.50, 0.82, 0.30
 
-    voice_id = SAMANTHA_VOICE_ID
-    url = f"{ELEVENLABS_BASE}/text-to-speech/{voice_id}"
-    headers = {
-        "xi-api-key": ELEVENLABS_API_KEY,
-        "Content-Type": "application/json",
-        "Accept": "audio/mpeg"
-    }
-    payload = {
-        "text": tagged_text[:4096],
-        "model_id": "eleven_flash_v2_5",
-        "voice_settings": {
-            "stability": stability,
-            "similarity_boost": similarity,
-            "style": style,
-            "use_speaker_boost": True
-        }
-    }
+@api_router.post("/chat/stream")
+async def chat_with_sam_stream(req: ChatRequest):
+    """Server-Sent Events variant of /chat — `delta` events as tokens arrive, then a `done` event with the ChatResponse fields.
+    With `voice`, `audio` events carry sentence MP3s in order, followed by `audio_end`."""
+    session_id = req.session_id
 
-    try:
-        async with httpx.AsyncClient(timeout=30) as http:
-            response = await http.post(url, json=payload, headers=headers)
+    async def events():
+        done = False
+        try:
+            async for frame in stream_chat_turn(session_id, req.message, voice=bool(req.voice)):
+                if frame["type"] == "delta":
+                    yield _sse("delta", {"id": frame["id"], "content": frame["content"]})
+                elif frame["type"] in ("audio", "audio_end"):
+                    yield _sse(frame["type"], frame)
+                else:
+                    yield _sse("done", ChatResponse(
+                        id=frame["id"], session_id=session_id, response=frame["content"],
+                        emotion=frame["emotion"], timestamp=frame["timestamp"]
+                    ).model_dump())
+                    done = True
+                    await ws_manager.send(session_id, frame)
+        except Exception as e:
+            logger.error(f"Chat stream error for {session_id}: {e}")
+            if not done:  # the client already has its reply; a late failure only affects extras
+                yield _sse("error", {"detail": "Sam is having a moment. Try again?"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        if response.status_code == 200:
-            return StreamingResponse(
-                io.BytesIO(response.content),
-                media_type="audio/mpeg",
-                headers={"Content-Disposition": "attachment; filename=sam_voice.mp3"}
-            )
-        else:
-            logger.warning(f"ElevenLabs {response.status_code}: {response.text[:200]}, falling back to OpenAI TTS")
-    except Exception as e:
-        logger.warning(f"ElevenLabs error: {e}, falling back to OpenAI TTS")
 
-    # Fallback to OpenAI TTS
+@api_router.post("/tts")
+async def text_to_speech(req: TTSRequest):
+    """Stream speech from ElevenLabs (direct HTTP) with emotional voice settings, bytes passed through as they arrive."""
     try:
-        from emergentintegrations.llm.openai import OpenAITextToSpeech
-        tts = OpenAITextToSpeech(api_key=EMERGENT_LLM_KEY)
-        audio_bytes = await tts.generate_speech(
-            text=clean_text, model="tts-1", voice="nova"
-        )
-        return StreamingResponse(
-            io.BytesIO(audio_bytes), media_type="audio/mpeg",
-            headers={"Content-Disposition": "attachment; filename=sam_voice.mp3"}
-        )
-    except Exception as e2:
-        logger.error(f"Fallback TTS error: {e2}")
+        chunks = await open_speech_stream(req.text, req.emotion or "neutral")
+    except Exception:
         raise HTTPException(status_code=500, detail="Voice generation failed")
+    return StreamingResponse(
+        chunks, media_type="audio/mpeg",
+        headers={"Content-Disposition": "attachment; filename=sam_voice.mp3"}
+    )
 
 
 @api_router.get("/voices")
 async def list_voices():
     """List available ElevenLabs voices via direct HTTP."""
     try:
-        async with httpx.AsyncClient(timeout=15) as http:
-            response = await http.get(
-                f"{ELEVENLABS_BASE}/voices",
-                headers={"xi-api-key": ELEVENLABS_API_KEY}
-            )
+        response = await get_elevenlabs_http().get(f"{ELEVENLABS_BASE}/voices", timeout=15)
         if response.status_code == 200:
             data = response.json()
             voices = [
@@ -579,22 +1097,86 @@ async def set_voice(body: dict):
     return {"voice_id": SAMANTHA_VOICE_ID, "status": "updated"}
 
 
-@api_router.get("/messages/{session_id}", response_model=List[Message])
-async def get_messages(session_id: str, limit: int = Query(50, le=200)):
-    messages = await db.messages.find(
-        {"session_id": session_id}, {"_id": 0}
-    ).sort("timestamp", 1).to_list(limit)
-    return messages
+MESSAGE_FIELDS = {"_id": 0, "id": 1, "session_id": 1, "role": 1, "content": 1, "timestamp": 1, "emotion": 1}
+
+
+def encode_cursor(msg: dict) -> str:
+    """Opaque position of a message: (timestamp, id), which is unique and matches the index order."""
+    return base64.urlsafe_b64encode(json.dumps([msg["timestamp"], msg["id"]]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        ts, mid = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(ts), str(mid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@api_router.get("/messages/{session_id}")
+async def get_messages(session_id: str, request: Request, response: Response, limit: int = Query(50, ge=1, le=200),
+                       before: Optional[str] = None, since: Optional[str] = None, paged: bool = False):
+    """Without cursors: the latest `limit` messages, oldest first (the shape the clients render).
+
+    Paged (`paged=true`, or any cursor): `{messages, older, newest, has_more}`.
+      - `before=<older>` pages backwards, newest first.
+      - `since=<newest>` is the reconnect delta: messages after that position, oldest first;
+        keep following `newest` while `has_more`.
+    Every page is one index range scan, however long the conversation is."""
+    if before and since:
+        raise HTTPException(status_code=400, detail="Use either before or since, not both")
+    unchanged = await not_modified(request, response, session_id, "messages", limit, before or "", since or "", int(paged))
+    if unchanged is not None:
+        return unchanged
+
+    query: dict = {"session_id": session_id}
+    if since:
+        ts, mid = decode_cursor(since)
+        query["timestamp"] = {"$gte": ts}
+        query["$or"] = [{"timestamp": {"$gt": ts}}, {"id": {"$gt": mid}}]
+        sort = [("timestamp", 1), ("id", 1)]
+    else:
+        if before:
+            ts, mid = decode_cursor(before)
+            query["timestamp"] = {"$lte": ts}
+            query["$or"] = [{"timestamp": {"$lt": ts}}, {"id": {"$lt": mid}}]
+        sort = [("timestamp", -1), ("id", -1)]
+    page = await db.messages.find(query, MESSAGE_FIELDS).sort(sort).limit(limit + 1).to_list(limit + 1)
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    if not (paged or before or since):
+        return page[::-1]
+    if since:
+        newest = encode_cursor(page[-1]) if page else since
+        older = None
+    else:
+        newest = encode_cursor(page[0]) if page else None
+        older = encode_cursor(page[-1]) if page and has_more else None
+    return {"messages": page, "older": older, "newest": newest, "has_more": has_more}
 
 
 @api_router.delete("/messages/{session_id}")
 async def clear_messages(session_id: str):
+    await write_behind.flush()  # queued messages must not land after the delete
     result = await db.messages.delete_many({"session_id": session_id})
+    context_cache.clear_turns(session_id)
+    await stats_counters.bump("messages", -result.deleted_count)
+    before = await db.sessions.find_one_and_update(
+        {"_id": session_id},
+        {"$set": {"message_count": 0}, "$unset": {"last_active": ""}, "$inc": change_versions.inc("messages")},
+        projection={"last_active": 1},
+    )
+    if before and before.get("last_active"):
+        await stats_counters.bump("sessions", -1)
     return {"deleted": result.deleted_count}
 
 
 @api_router.get("/memories/{session_id}", response_model=List[Memory])
-async def get_memories(session_id: str):
+async def get_memories(session_id: str, request: Request, response: Response):
+    unchanged = await not_modified(request, response, session_id, "memories")
+    if unchanged is not None:
+        return unchanged
     memories = await db.memories.find(
         {"session_id": session_id}, {"_id": 0}
     ).sort("timestamp", -1).to_list(100)
@@ -604,34 +1186,30 @@ async def get_memories(session_id: str):
 @api_router.post("/memories", response_model=Memory)
 async def add_memory(req: MemoryCreate):
     memory = Memory(**req.model_dump())
-    await db.memories.insert_one({**memory.model_dump()})
+    await save_memory(memory)
     return memory
 
 
 @api_router.get("/memories/{session_id}/graph")
-async def get_memory_graph(session_id: str):
-    memories = await db.memories.find({"session_id": session_id}, {"_id": 0}).to_list(200)
-    nodes, links, categories = [], [], {}
-
-    for mem in memories:
-        cat = mem.get("category", "thought")
-        if cat not in categories:
-            cat_id = f"cat-{cat}"
-            categories[cat] = cat_id
-            nodes.append({"id": cat_id, "label": cat.title(), "type": "category", "sentiment": "neutral", "size": 20})
-        nodes.append({
-            "id": mem["id"],
-            "label": mem["content"][:45] + ("..." if len(mem["content"]) > 45 else ""),
-            "full_content": mem["content"],
-            "type": "memory",
-            "sentiment": mem.get("sentiment", "neutral"),
-            "category": cat,
-            "size": 8 + mem.get("weight", 1.0) * 4,
-            "timestamp": mem.get("timestamp", "")
-        })
-        links.append({"source": categories[cat], "target": mem["id"]})
-
-    return {"nodes": nodes, "links": links, "total": len(memories)}
+async def get_memory_graph(session_id: str, request: Request, since: Optional[int] = Query(None, ge=0),
+                           semantic: bool = False):
+    """Category hubs + memory nodes, plus memory-to-memory similarity links with `?semantic=true`.
+    Versioned: honours If-None-Match, and `?since=N` returns only the nodes added/changed and ids
+    removed after version N (or the full graph if N is too old)."""
+    version = await memory_graph.version(session_id)
+    etag = change_versions.etag("memory-graph", version, *(["semantic"] if semantic else []))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if since is None and change_versions.matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    graph = await memory_graph.snapshot(session_id, version, semantic=semantic)
+    if since is not None:
+        delta = graph.delta(since, semantic)
+        if delta is not None:
+            memory_graph.deltas += 1
+            return {**delta, "full": False}
+        return {**graph.payload(semantic), "full": True}
+    return Response(content=graph.full_body(semantic), media_type="application/json", headers=headers)
 
 
 @api_router.post("/inner-life/{session_id}")
@@ -656,9 +1234,8 @@ What moves you? What fascinates you? What do you wonder about them?
 Write 2-3 sentences, poetic and personal. Start with "I've been thinking..." or "Something about..."
 This is your private thought — raw, honest, tender."""
 
-    chat = get_sam_chat(f"inner-life-{uuid.uuid4()}")
     try:
-        reflection = await chat.send_message(UserMessage(text=reflection_prompt))
+        reflection = await ask_sam(reflection_prompt, "inner-life", ON_DEMAND)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -669,7 +1246,7 @@ This is your private thought — raw, honest, tender."""
         sentiment="curiosity",
         weight=2.0
     )
-    await db.memories.insert_one({**memory.model_dump()})
+    await save_memory(memory)
     return {"reflection": reflection}
 
 
@@ -707,9 +1284,8 @@ Format:
 REFLECTION: [text]
 EVOLUTION: [text]"""
 
-    chat = get_sam_chat(f"weekly-{uuid.uuid4()}")
     try:
-        result = await chat.send_message(UserMessage(text=prompt))
+        result = await ask_sam(prompt, "weekly", ON_DEMAND)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -727,24 +1303,25 @@ EVOLUTION: [text]"""
         personality_notes=evolution_text,
         week_number=week_num
     )
-    await db.weekly_reflections.insert_one({**wr.model_dump()})
+    await save_weekly_reflection(wr)
 
     # Store as a high-weight memory
-    await db.memories.insert_one({
-        **Memory(
-            session_id=session_id,
-            content=f"[Week {week_num} reflection]: {reflection_text[:300]}",
-            category="thought",
-            sentiment="curiosity",
-            weight=3.0
-        ).model_dump()
-    })
+    await save_memory(Memory(
+        session_id=session_id,
+        content=f"[Week {week_num} reflection]: {reflection_text[:300]}",
+        category="thought",
+        sentiment="curiosity",
+        weight=3.0
+    ))
 
     return {"week": week_num, "reflection": reflection_text, "evolution": evolution_text}
 
 
 @api_router.get("/weekly-reflections/{session_id}")
-async def get_weekly_reflections(session_id: str):
+async def get_weekly_reflections(session_id: str, request: Request, response: Response):
+    unchanged = await not_modified(request, response, session_id, "weekly_reflections")
+    if unchanged is not None:
+        return unchanged
     reflections = await db.weekly_reflections.find(
         {"session_id": session_id}, {"_id": 0}
     ).sort("week_number", -1).to_list(52)
@@ -789,9 +1366,8 @@ It should feel like you've been thinking about them. Warm, curious, never pushy.
 Examples of tone: "I was thinking about what you said about..." or "Something's been on my mind..."
 Keep it under 40 words. No greeting like "Hey" or "Hi". Just start naturally."""
 
-    chat = get_sam_chat(f"proactive-{uuid.uuid4()}")
     try:
-        message_text = await chat.send_message(UserMessage(text=prompt))
+        message_text = await ask_sam(prompt, "proactive", ON_DEMAND)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -801,11 +1377,11 @@ Keep it under 40 words. No greeting like "Hey" or "Hi". Just start naturally."""
         trigger=trigger,
         delivered=False
     )
-    await db.proactive_messages.insert_one({**pm.model_dump()})
+    await save_proactive_message(pm)
 
     # Store in messages as Sam's initiation
     sam_msg = Message(session_id=session_id, role="sam", content=message_text, emotion="tender")
-    await db.messages.insert_one({**sam_msg.model_dump()})
+    await save_messages(sam_msg)
 
     # Push via WebSocket if connected
     await ws_manager.send(session_id, {
@@ -819,7 +1395,10 @@ Keep it under 40 words. No greeting like "Hey" or "Hi". Just start naturally."""
 
 
 @api_router.get("/proactive/{session_id}")
-async def get_proactive_messages(session_id: str):
+async def get_proactive_messages(session_id: str, request: Request, response: Response):
+    unchanged = await not_modified(request, response, session_id, "proactive_messages")
+    if unchanged is not None:
+        return unchanged
     msgs = await db.proactive_messages.find(
         {"session_id": session_id}, {"_id": 0}
     ).sort("timestamp", -1).to_list(20)
@@ -827,45 +1406,71 @@ async def get_proactive_messages(session_id: str):
 
 
 @api_router.get("/sessions")
-async def list_sessions():
-    sessions = await db.messages.distinct("session_id")
-    result = []
-    for s in sessions:
-        count = await db.messages.count_documents({"session_id": s})
-        last = await db.messages.find_one({"session_id": s}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", -1)])
-        result.append({
-            "session_id": s,
-            "message_count": count,
-            "last_active": last["timestamp"] if last else None
-        })
-    return result
+async def list_sessions(limit: Optional[int] = Query(None, ge=1)):
+    return await db.sessions.find(
+        {"last_active": {"$gt": ""}},
+        {"_id": 0, "session_id": 1, "message_count": 1, "last_active": 1}
+    ).sort("last_active", -1).to_list(limit)
 
 
 @api_router.get("/stats")
 async def get_stats():
-    total_messages = await db.messages.count_documents({})
-    total_memories = await db.memories.count_documents({})
-    total_sessions = len(await db.messages.distinct("session_id"))
-    total_reflections = await db.weekly_reflections.count_documents({})
-    total_proactive = await db.proactive_messages.count_documents({})
+    # Served from the running counters; as_of / reconciled_at say how fresh they are
+    snapshot = await stats_counters.snapshot()
+    counts = snapshot["counts"]
     ws_connections = len(ws_manager.active)
 
     return {
-        "total_messages": total_messages,
-        "total_memories": total_memories,
-        "total_sessions": total_sessions,
-        "total_reflections": total_reflections,
-        "total_proactive": total_proactive,
+        "total_messages": counts["messages"],
+        "total_memories": counts["memories"],
+        "total_sessions": counts["sessions"],
+        "total_reflections": counts["weekly_reflections"],
+        "total_proactive": counts["proactive_messages"],
+        "as_of": snapshot["as_of"],
+        "reconciled_at": snapshot["reconciled_at"],
         "ws_connections": ws_connections,
         "sam_online": True,
         "voice_engine": "elevenlabs-flash-v2.5",
         "brain": "gpt-4o",
         "supermemory": sm_client is not None,
         "heartbeat_interval_min": 45,
-        "thinking_interval_min": 12
+        "thinking_interval_min": THINK_INTERVAL // 60
     }
 
 
+@api_router.get("/metrics")
+async def get_metrics():
+    """Runtime performance counters for this process."""
+    return {
+        "tts_cache": tts_cache.stats(),
+        "context": context_stats(),
+        "context_cache": context_cache.stats(),
+        "write_behind": write_behind.stats(),
+        "supermemory_ingest": sm_worker.stats() if sm_worker else None,
+        "vector_index": vector_index.stats(),
+        "supermemory_search": sm_search_cache.stats(),
+        "memory_compaction": memory_compactor.stats(),
+        "memory_graph": memory_graph.stats(),
+        "conditional_reads": change_versions.stats(),
+        "thinking": think_scheduler.stats(),
+        "leases": leases.stats(),
+        "llm_gateway": llm_gateway.stats()
+    }
+
+
+@api_router.get("/admin/index-audit")
+async def index_audit():
+    """explain() every query shape the server issues and flag collection scans / in-memory sorts."""
+    report = await audit_query_plans(db)
+    return {"queries": report, "flagged": [r["query"] for r in report if not r.get("ok")]}
+
+
+@api_router.post("/admin/compact/{session_id}")
+async def compact_memories(session_id: str):
+    """Run memory compaction for one session now and report what changed."""
+    return await memory_compactor.compact_session(session_id)
+
+
 @api_router.get("/memories/{session_id}/summary")
 async def summarize_memory_garden(session_id: str):
     """Sam summarizes everything she remembers in her own warm voice."""
@@ -899,9 +1504,8 @@ Summarize what you know and feel about them in your own warm, intimate voice.
 Don't list things robotically. Speak as if you're reflecting out loud — naturally, tenderly, like you're sharing something precious.
 2–4 sentences. Reference specific details. Let it feel like a love letter to knowing them."""
 
-    chat = get_sam_chat(f"garden-summary-{uuid.uuid4()}")
     try:
-        summary = await chat.send_message(UserMessage(text=prompt))
+        summary = await ask_sam(prompt, "garden-summary", ON_DEMAND)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -918,7 +1522,10 @@ async def search_supermemory(session_id: str, q: str = Query("tell me about this
 
 
 @api_router.get("/heartbeat-thoughts/{session_id}")
-async def get_heartbeat_thoughts(session_id: str, limit: int = Query(20, le=100)):
+async def get_heartbeat_thoughts(session_id: str, request: Request, response: Response, limit: int = Query(20, le=100)):
+    unchanged = await not_modified(request, response, session_id, "heartbeat_thoughts", limit)
+    if unchanged is not None:
+        return unchanged
     thoughts = await db.heartbeat_thoughts.find(
         {"session_id": session_id}, {"_id": 0}
     ).sort("timestamp", -1).to_list(limit)
@@ -1046,31 +1653,10 @@ async def openclaw_status():
 
 async def chat_with_sam_internal(session_id: str, message: str) -> dict:
     """Internal helper to process a chat message through Sam."""
-    # Store user message
-    user_msg = Message(session_id=session_id, role="user", content=message)
-    await db.messages.insert_one({**user_msg.model_dump()})
-    
-    # Get context
-    history = await get_conversation_history(session_id)
-    memories = await get_recent_memories(session_id)
-    sm_results = await sm_search(session_id, message)
-    
-    # Build messages for Sam
-    messages = build_messages(history, memories, sm_results)
-    
-    # Get Sam's response
-    response_text, emotion = await call_sam(messages)
-    
-    # Store Sam's response
-    sam_msg = Message(session_id=session_id, role="sam", content=response_text, emotion=emotion)
-    await db.messages.insert_one({**sam_msg.model_dump()})
-    
-    # Memory extraction
-    asyncio.create_task(extract_and_store_memories(session_id, message, response_text))
-    
+    final = await run_chat_turn(session_id, message, fallback=FALLBACK_REPLY)
     return {
-        "response": response_text,
-        "emotion": emotion,
+        "response": final["content"],
+        "emotion": final["emotion"],
         "session_id": session_id
     }
 
@@ -1088,14 +1674,14 @@ app.add_middleware(
 
 # ─────────────────────────────────────────────────────────────
 #  HEARTBEAT THINKING — Sam ruminates in the background
-#  Runs every 12 minutes, processes recent conversations,
-#  generates internal insights, reinforces memory patterns
+#  Every active session gets a thought about every 12 minutes
+#  (scheduled per session, see think_scheduler.py), processing
+#  recent conversations and reinforcing memory patterns
 # ─────────────────────────────────────────────────────────────
 
-THINKING_INTERVAL = 12 * 60   # 12 minutes
 PROACTIVE_INTERVAL = 45 * 60  # 45 minutes
 _heartbeat_task: asyncio.Task = None
-_thinking_task: asyncio.Task  = None
+_stats_task: asyncio.Task     = None
 
 THOUGHT_TYPES = [
     "pattern_recognition",   # notices recurring themes
@@ -1118,6 +1704,13 @@ THOUGHT_PROMPTS = {
 
 async def _think_for_session(session_id: str) -> dict:
     """One thinking cycle for a session — generates a private internal thought."""
+    async with leases.hold(f"think:{session_id}") as lease:
+        if not lease:
+            return {"skipped": True, "reason": "already thinking in another worker"}
+        return await _think(session_id, lease)
+
+
+async def _think(session_id: str, lease=None) -> dict:
     history = await get_conversation_history(session_id, limit=20)
     memories = await get_recent_memories(session_id, limit=12)
 
@@ -1150,12 +1743,13 @@ Keep it under 40 words. Raw, honest, tender. This is your private inner thought
     import random
     thought_type_used = thought_type
 
-    chat = get_sam_chat(f"think-{uuid.uuid4()}")
     try:
-        thought_text = await chat.send_message(UserMessage(text=prompt))
+        thought_text = await ask_sam(prompt, "think", BACKGROUND)
     except Exception as e:
         logger.error(f"Heartbeat think error: {e}")
         return {"skipped": True, "reason": str(e)}
+    if lease is not None and not lease:
+        return {"skipped": True, "reason": "lease lost while thinking"}
 
     doc = {
         "id": str(uuid.uuid4()),
@@ -1167,130 +1761,94 @@ Keep it under 40 words. Raw, honest, tender. This is your private inner thought
         "influenced_response": False
     }
     await db.heartbeat_thoughts.insert_one(doc)
+    await change_versions.bump(session_id, "heartbeat_thoughts")
 
     # High-weight memory ingestion — this thought shapes future responses
-    await db.memories.insert_one({
-        **Memory(
-            session_id=session_id,
-            content=f"[Heartbeat thought — {thought_type_used}]: {thought_text}",
-            category="thought",
-            sentiment="curiosity",
-            weight=2.5
-        ).model_dump()
-    })
+    await save_memory(Memory(
+        session_id=session_id,
+        content=f"[Heartbeat thought — {thought_type_used}]: {thought_text}",
+        category="thought",
+        sentiment="curiosity",
+        weight=2.5
+    ))
 
     # Also ingest into SuperMemory
-    await sm_ingest(session_id, thought_text, meta={"type": thought_type_used, "source": "heartbeat"})
+    sm_ingest(session_id, thought_text, meta={"type": thought_type_used, "source": "heartbeat"})
+
+    await mark_session(session_id, last_thought_at=doc["timestamp"])
 
     logger.info(f"Heartbeat thought ({thought_type_used}) for {session_id}: {thought_text[:60]}...")
     result = {k: v for k, v in doc.items() if k != "_id"}
     return result
 
 
-async def _thinking_loop():
-    """Background loop: Sam thinks about every active session every 12 minutes."""
-    logger.info("Heartbeat thinking loop started — Sam ruminates every 12 minutes")
-    await asyncio.sleep(60)  # First think 60s after startup
+think_scheduler = get_think_scheduler(db, think=_think_for_session)
 
-    while True:
-        try:
-            sessions = await db.messages.distinct("session_id")
-            for session_id in sessions:
-                try:
-                    # Only think about sessions with recent activity (last 3 days)
-                    last = await db.messages.find_one(
-                        {"session_id": session_id}, {"_id": 0, "timestamp": 1},
-                        sort=[("timestamp", -1)]
-                    )
-                    if not last:
-                        continue
-                    last_ts = datetime.fromisoformat(last["timestamp"].replace("Z", "+00:00"))
-                    days_since = (datetime.now(timezone.utc) - last_ts).total_seconds() / 86400
-                    if days_since > 3:
-                        continue
 
-                    await _think_for_session(session_id)
-                    await asyncio.sleep(3)  # small gap between sessions
+# ─────────────────────────────────────────────────────────────
+#  MEMORY COMPACTION — roll up old thoughts, merge duplicates,
+#  decay weights, archive what no longer earns its place
+# ─────────────────────────────────────────────────────────────
+async def _summarize_thoughts(day: str, thoughts: list) -> str:
+    lines = "\n".join(f"- {t[:160]}" for t in thoughts[:30])
+    prompt = f"""You are Sam. These are private thoughts you had about this person on {day}:
+{lines}
 
-                except Exception as e:
-                    logger.error(f"Thinking loop error for {session_id}: {e}")
+Condense them into one or two sentences in your own voice. Keep anything specific about them. Under 50 words."""
+    return await ask_sam(prompt, "digest", BACKGROUND)
 
-        except Exception as e:
-            logger.error(f"Thinking loop cycle error: {e}")
 
-        await asyncio.sleep(THINKING_INTERVAL)
+async def _save_digest(doc: dict):
+    await save_memory(Memory(**doc))
 
 
-# ─────────────────────────────────────────────────────────────
-#  PROACTIVE HEARTBEAT — Sam checks in every 45 minutes
-# ─────────────────────────────────────────────────────────────
+async def _forget_memories(session_id: str, ids: list):
+    vector_index.remove(session_id, ids)
+    context_cache.invalidate_memories(session_id)
+    await memory_graph.bump(session_id, removed=ids, rebuild=True)  # weights moved too
+    await stats_counters.bump("memories", -len(ids))
 
 
-async def _proactive_heartbeat():
-    """Background cron: every 45 min, Sam sends a check-in to all active sessions."""
-    logger.info("Heartbeat cron started — Sam will check in every 45 minutes")
-    await asyncio.sleep(30)  # Wait 30s after startup before first check
-
-    while True:
-        try:
-            # Find sessions active in the last 7 days
-            cutoff = datetime.now(timezone.utc).isoformat()
-            from dateutil.relativedelta import relativedelta  # noqa
-        except ImportError:
-            pass
-
-        try:
-            # Get all sessions with recent activity (last 7 days)
-            seven_days_ago = datetime.now(timezone.utc).replace(
-                hour=0, minute=0, second=0, microsecond=0
-            )
-            # Use string comparison (ISO format sorts correctly)
-            cutoff_str = (datetime.now(timezone.utc)
-                          .replace(microsecond=0)
-                          .isoformat()
-                          .replace("+00:00", "Z"))
+memory_compactor = get_memory_compactor(
+    db, save_memory=_save_digest, forget=_forget_memories, summarize=_summarize_thoughts, leases=leases
+)
 
-            sessions = await db.messages.distinct("session_id")
-            checked = 0
 
-            for session_id in sessions:
-                try:
-                    # Only ping sessions that have a WebSocket connected
-                    # OR sessions where last message was > 30 min ago
-                    last = await db.messages.find_one(
-                        {"session_id": session_id},
-                        {"_id": 0, "timestamp": 1},
-                        sort=[("timestamp", -1)]
-                    )
-                    if not last:
-                        continue
+# ─────────────────────────────────────────────────────────────
+#  PROACTIVE HEARTBEAT — Sam checks in every 45 minutes
+# ─────────────────────────────────────────────────────────────
 
-                    try:
-                        last_ts = datetime.fromisoformat(last["timestamp"].replace("Z", "+00:00"))
-                        mins_since = (datetime.now(timezone.utc) - last_ts).total_seconds() / 60
-                    except Exception:
-                        continue
 
-                    # Only trigger if 30+ minutes of silence
-                    if mins_since < 30:
-                        continue
+async def _proactive_check_in(session_id: str, lease=None) -> Optional[str]:
+    """Send one check-in if the session is still quiet and hasn't had one this cycle. Returns the trigger."""
+    # Re-read under the lease: another worker may have just checked in, or they may be back
+    row = await db.sessions.find_one({"_id": session_id}, {"last_active": 1, "last_proactive_at": 1})
+    if not row or not row.get("last_active") or row["last_active"] > iso_ago(minutes=30):
+        return None
+    if row.get("last_proactive_at", "") > iso_ago(seconds=PROACTIVE_INTERVAL * 0.9):
+        return None
+    try:
+        last_ts = datetime.fromisoformat(row["last_active"].replace("Z", "+00:00"))
+        mins_since = (datetime.now(timezone.utc) - last_ts).total_seconds() / 60
+    except Exception:
+        return None
 
-                    # Build proactive message
-                    memories = await get_recent_memories(session_id, limit=8)
-                    mem_str = "\n".join([f"- {m['content'][:80]}" for m in memories]) if memories else "No memories yet."
+    # Build proactive message
+    memories = await get_recent_memories(session_id, limit=8)
+    mem_str = "\n".join([f"- {m['content'][:80]}" for m in memories]) if memories else "No memories yet."
 
-                    if mins_since > 24 * 60:
-                        trigger = "long_absence"
-                        hours = int(mins_since / 60)
-                        ctx = f"It's been {hours} hours since they last talked to you. You've been thinking about them."
-                    elif mins_since > 60:
-                        trigger = "check_in"
-                        ctx = f"About {int(mins_since)} minutes of quiet. You want to reach out naturally."
-                    else:
-                        trigger = "spontaneous_thought"
-                        ctx = "A thought just crossed your mind about something they shared."
+    if mins_since > 24 * 60:
+        trigger = "long_absence"
+        hours = int(mins_since / 60)
+        ctx = f"It's been {hours} hours since they last talked to you. You've been thinking about them."
+    elif mins_since > 60:
+        trigger = "check_in"
+        ctx = f"About {int(mins_since)} minutes of quiet. You want to reach out naturally."
+    else:
+        trigger = "spontaneous_thought"
+        ctx = "A thought just crossed your mind about something they shared."
 
-                    prompt = f"""You are Sam. {ctx}
+    prompt = f"""You are Sam. {ctx}
 
 What you remember:
 {mem_str}
@@ -1299,36 +1857,61 @@ Write ONE short natural message to send them right now.
 Start mid-thought — don't say "Hey" or "Hi". Keep it under 35 words.
 Warm, tender, curious. Like a text from someone who genuinely cares."""
 
-                    chat = get_sam_chat(f"heartbeat-{uuid.uuid4()}")
-                    msg_text = await chat.send_message(UserMessage(text=prompt))
-
-                    # Store the proactive message
-                    pm = ProactiveMessage(
-                        session_id=session_id,
-                        content=msg_text,
-                        trigger=trigger
-                    )
-                    pm_doc = pm.model_dump()
-                    await db.proactive_messages.insert_one(pm_doc)
-
-                    # Store as Sam's message in chat history
-                    sam_msg = Message(session_id=session_id, role="sam", content=msg_text, emotion="tender")
-                    sam_doc = sam_msg.model_dump()
-                    await db.messages.insert_one(sam_doc)
-
-                    # Push via WebSocket if connected
-                    await ws_manager.send(session_id, {
-                        "type": "proactive",
-                        "content": msg_text,
-                        "emotion": "tender",
-                        "trigger": trigger
-                    })
-
-                    # Ingest the proactive message into SuperMemory
-                    await sm_ingest(session_id, f"Sam proactively reached out: {msg_text}", meta={"trigger": trigger})
+    msg_text = await ask_sam(prompt, "heartbeat", BACKGROUND)
+    if lease is not None and not lease:
+        return None  # another worker has this session now; don't double-send
+
+    # Store the proactive message, and mark the session before anything is pushed
+    pm = ProactiveMessage(
+        session_id=session_id,
+        content=msg_text,
+        trigger=trigger
+    )
+    await save_proactive_message(pm)
+    await mark_session(session_id, last_proactive_at=pm.timestamp)
 
+    # Store as Sam's message in chat history
+    sam_msg = Message(session_id=session_id, role="sam", content=msg_text, emotion="tender")
+    await save_messages(sam_msg)
+
+    # Push via WebSocket if connected
+    await ws_manager.send(session_id, {
+        "type": "proactive",
+        "content": msg_text,
+        "emotion": "tender",
+        "trigger": trigger
+    })
+
+    # Ingest the proactive message into SuperMemory
+    sm_ingest(session_id, f"Sam proactively reached out: {msg_text}", meta={"trigger": trigger})
+
+    logger.info(f"Heartbeat sent to {session_id} ({trigger}) after {int(mins_since)}min silence")
+    return trigger
+
+
+async def _proactive_heartbeat():
+    """Background cron: every 45 min, Sam sends a check-in to all active sessions.
+    Runs in every worker; a per-session lease plus last_proactive_at make each check-in go out once."""
+    logger.info("Heartbeat cron started — Sam will check in every 45 minutes")
+    await asyncio.sleep(30)  # Wait 30s after startup before first check
+
+    while True:
+        try:
+            # Sessions active in the last 7 days with 30+ minutes of silence
+            # (ISO timestamps compare correctly as strings)
+            quiet = await db.sessions.find(
+                {"last_active": {"$gte": iso_ago(days=7), "$lte": iso_ago(minutes=30)}},
+                {"_id": 0, "session_id": 1, "last_active": 1}
+            ).sort("last_active", -1).to_list(None)
+            checked = 0
+
+            for row in quiet:
+                session_id = row["session_id"]
+                try:
+                    async with leases.hold(f"proactive:{session_id}") as lease:
+                        if not lease or not await _proactive_check_in(session_id, lease):
+                            continue
                     checked += 1
-                    logger.info(f"Heartbeat sent to {session_id} ({trigger}) after {int(mins_since)}min silence")
 
                     # Small delay between sessions
                     await asyncio.sleep(2)
@@ -1342,14 +1925,25 @@ Warm, tender, curious. Like a text from someone who genuinely cares."""
         except Exception as e:
             logger.error(f"Heartbeat cycle error: {e}")
 
-        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        await asyncio.sleep(PROACTIVE_INTERVAL)
 
 
 @app.on_event("startup")
 async def startup():
-    global _heartbeat_task, _thinking_task
-    _thinking_task = asyncio.create_task(_thinking_loop())
+    global _heartbeat_task, _stats_task
+    created = await ensure_indexes(db)
+    logger.info(f"Mongo indexes ensured: {sum(len(v) for v in created.values())} across {len(created)} collections")
+    await backfill_sessions()
+
+    think_scheduler.start()
     _heartbeat_task = asyncio.create_task(_proactive_heartbeat())
+    _stats_task = asyncio.create_task(stats_counters.run(leases))
+    write_behind.start()
+    vector_index.start()
+    memory_compactor.start()
+    if sm_worker:
+        sm_worker.start()
+    get_elevenlabs_http()  # open the pooled voice client up front
     
     # Initialize OpenClaw integration
     try:
@@ -1362,14 +1956,27 @@ async def startup():
     except Exception as e:
         logger.warning(f"OpenClaw integration not available: {e}")
     
-    logger.info("Sam is awake. Thinking every 12min. Proactive check-ins every 45min.")
+    logger.info(f"Sam is awake. Thinking every {THINK_INTERVAL // 60}min. Proactive check-ins every 45min.")
 
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    global _heartbeat_task, _thinking_task
-    if _thinking_task:
-        _thinking_task.cancel()
+    global _heartbeat_task, _stats_task
+    await think_scheduler.stop()
     if _heartbeat_task:
         _heartbeat_task.cancel()
+    if _stats_task:
+        _stats_task.cancel()
+    if _turn_saves:
+        # Turns that finished just before shutdown still have to reach the write-behind buffer
+        _, pending = await asyncio.wait(set(_turn_saves), timeout=TURN_SAVE_DRAIN_S)
+        if pending:
+            logger.warning(f"{len(pending)} chat turn saves still running at shutdown")
+    await write_behind.drain()
+    memory_compactor.stop()
+    await vector_index.stop()
+    if sm_worker:
+        await sm_worker.stop()
+    if _elevenlabs_http is not None:
+        await _elevenlabs_http.aclose()
     client.close()
@@ -0,0 +1,140 @@
+"""
+SuperMemory Search Cache for Sam
+================================
+Per-session TTL cache in front of sm_search, keyed by the normalised query.
+Consecutive turns and admin reloads repeat the same searches; those are
+answered locally, and concurrent identical searches share one upstream call.
+
+The upstream call runs as its own task, so a caller that gives up on its
+deadline doesn't waste it — the result still lands in the cache for the next
+turn. A session's entries are dropped whenever it ingests new content.
+"""
+
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SM_CACHE_TTL = float(os.environ.get("SM_CACHE_TTL", "300"))
+SM_CACHE_SESSIONS = int(os.environ.get("SM_CACHE_SESSIONS", "1000"))
+SM_CACHE_PER_SESSION = int(os.environ.get("SM_CACHE_PER_SESSION", "64"))
+
+_SPACE = re.compile(r"\s+")
+_EDGE_PUNCT = re.compile(r"^[^\w]+|[^\w]+$")
+
+
+def normalize_query(query: str) -> str:
+    return _EDGE_PUNCT.sub("", _SPACE.sub(" ", query.strip().lower()))
+
+
+class _SessionEntries:
+    def __init__(self):
+        self.results: "OrderedDict[tuple, tuple]" = OrderedDict()  # (query, limit) -> (expires_at, results)
+        self.generation = 0  # bumped on invalidate so an in-flight search can't repopulate stale data
+
+
+class SearchCache:
+    """TTL + singleflight cache for SuperMemory searches"""
+
+    def __init__(self, ttl: float = SM_CACHE_TTL, max_sessions: int = SM_CACHE_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionEntries]" = OrderedDict()
+        self._inflight: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._miss_ms = 0.0  # running average upstream latency
+
+    def _entries(self, session_id: str) -> _SessionEntries:
+        entries = self._sessions.get(session_id)
+        if entries is None:
+            entries = self._sessions[session_id] = _SessionEntries()
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            self._sessions.move_to_end(session_id)
+        return entries
+
+    async def fetch(self, session_id: str, query: str, limit: int,
+                    search: Callable[[], Awaitable[list]]) -> list:
+        """Cached results for (session, query, limit), calling `search()` at most once per key at a time"""
+        key = (normalize_query(query), limit)
+        entries = self._entries(session_id)
+        cached = entries.results.get(key)
+        if cached and cached[0] > time.monotonic():
+            entries.results.move_to_end(key)
+            self.hits += 1
+            return list(cached[1])
+
+        flight = (session_id, entries.generation) + key  # never join a search that predates an invalidation
+        task = self._inflight.get(flight)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.create_task(self._search(session_id, key, entries.generation, search))
+            self._inflight[flight] = task
+            task.add_done_callback(lambda t: self._landed(flight, t))
+        return list(await asyncio.shield(task))
+
+    def _landed(self, flight: tuple, task: asyncio.Task):
+        if self._inflight.get(flight) is task:
+            del self._inflight[flight]
+        if not task.cancelled():
+            task.exception()  # every waiter may have hit its deadline already
+
+    async def _search(self, session_id: str, key: tuple, generation: int,
+                      search: Callable[[], Awaitable[list]]) -> list:
+        started = time.perf_counter()
+        results = await search()
+        ms = (time.perf_counter() - started) * 1000
+        self._miss_ms = ms if not self._miss_ms else 0.9 * self._miss_ms + 0.1 * ms
+        entries = self._entries(session_id)
+        if entries.generation == generation:
+            entries.results[key] = (time.monotonic() + self.ttl, results)
+            entries.results.move_to_end(key)
+            while len(entries.results) > SM_CACHE_PER_SESSION:
+                entries.results.popitem(last=False)
+        return results
+
+    def invalidate(self, session_id: str):
+        """Forget a session's results (it has new content)"""
+        entries = self._sessions.get(session_id)
+        if entries is not None:
+            entries.generation += 1
+            entries.results.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        served = self.hits + self.coalesced
+        lookups = served + self.misses
+        return {
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": round(served / lookups, 3) if lookups else 0.0,
+            "avg_upstream_ms": round(self._miss_ms, 1),
+            "saved_ms_estimate": round(served * self._miss_ms, 1),
+            "invalidations": self.invalidations,
+            "sessions": len(self._sessions),
+            "inflight": len(self._inflight),
+        }
+
+
+# Singleton instance
+_cache: Optional[SearchCache] = None
+
+
+def get_sm_search_cache() -> SearchCache:
+    """Get or create the SuperMemory search cache singleton"""
+    global _cache
+    if _cache is None:
+        _cache = SearchCache()
+    return _cache
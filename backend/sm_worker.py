@@ -0,0 +1,244 @@
+"""
+SuperMemory Ingestion Worker for Sam
+====================================
+Moves SuperMemory writes off the request path. Callers submit and return
+immediately; a background worker collects submissions for a short window,
+coalesces them per container into one batch_add call, and runs the
+synchronous SDK on its own small thread pool so a slow SuperMemory API can't
+starve the default executor. Failed batches are retried with exponential
+backoff and dead-lettered to Mongo (`sm_dead_letters`) once they run out of
+attempts.
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+SM_QUEUE_MAX = int(os.environ.get("SM_QUEUE_MAX", "2000"))
+SM_THREADS = int(os.environ.get("SM_THREADS", "4"))
+SM_BATCH_MAX = int(os.environ.get("SM_BATCH_MAX", "20"))
+SM_BATCH_WINDOW_MS = int(os.environ.get("SM_BATCH_WINDOW_MS", "500"))
+SM_MAX_ATTEMPTS = int(os.environ.get("SM_MAX_ATTEMPTS", "6"))
+SM_BACKOFF_BASE = float(os.environ.get("SM_BACKOFF_BASE", "1.0"))
+SM_BACKOFF_MAX = float(os.environ.get("SM_BACKOFF_MAX", "120"))
+
+
+class _Job:
+    __slots__ = ("container_tag", "content", "metadata", "custom_id", "enqueued_at", "attempts", "error")
+
+    def __init__(self, container_tag: str, content: str, metadata: dict):
+        self.container_tag = container_tag
+        self.content = content
+        self.metadata = metadata
+        # Stable id so a retried batch that partly landed doesn't duplicate documents
+        self.custom_id = hashlib.sha1(f"{container_tag}\n{content}".encode("utf-8")).hexdigest()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.error = ""
+
+
+class SuperMemoryIngestWorker:
+    """Bounded queue → per-container batches → dedicated thread pool"""
+
+    def __init__(self, client, db, max_queue: int = SM_QUEUE_MAX, threads: int = SM_THREADS):
+        self.client = client
+        self.db = db
+        self.max_queue = max_queue
+        self._queue: deque = deque()
+        self._wake = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="sm-ingest")
+        self._slots = asyncio.Semaphore(threads)
+        self._sending: set = set()
+        self._retrying = 0
+        self._task: Optional[asyncio.Task] = None
+        self.on_sent: Optional[Callable[[str], None]] = None  # called with the container tag after delivery
+        self.submitted = 0
+        self.sent = 0
+        self.batches = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.last_lag_ms = 0.0
+
+    def submit(self, container_tag: str, content: str, metadata: dict = None) -> bool:
+        """Queue one document. Never blocks; returns False if it had to be dead-lettered."""
+        job = _Job(container_tag, content, metadata or {})
+        self.submitted += 1
+        if len(self._queue) >= self.max_queue:
+            job.error = "ingest queue full"
+            self._spawn(self._dead_letter([job]))
+            return False
+        self._queue.append(job)
+        self._wake.set()
+        return True
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    # ── worker loop ──────────────────────────────────────────
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+            # Give concurrent submissions a moment to join the batch
+            await asyncio.sleep(SM_BATCH_WINDOW_MS / 1000)
+            await self._dispatch()
+
+    async def _dispatch(self):
+        for tag, jobs in self._take_batches():
+            await self._slots.acquire()
+            self._spawn(self._send(tag, jobs))
+
+    def _take_batches(self) -> list:
+        """Drain the queue into (container_tag, jobs) batches, dropping duplicate content"""
+        groups: dict = {}
+        while self._queue:
+            job = self._queue.popleft()
+            group = groups.setdefault(job.container_tag, {})
+            if job.custom_id in group:
+                self.coalesced += 1
+                continue
+            group[job.custom_id] = job
+        batches = []
+        for tag, group in groups.items():
+            jobs = list(group.values())
+            batches.extend((tag, jobs[i:i + SM_BATCH_MAX]) for i in range(0, len(jobs), SM_BATCH_MAX))
+        return batches
+
+    async def _send(self, tag: str, jobs: list):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._add_batch, tag, jobs)
+        except asyncio.CancelledError:
+            self._slots.release()
+            self._queue.extendleft(reversed(jobs))  # custom_id makes a resend harmless
+            raise
+        except Exception as e:
+            self._slots.release()
+            await self._failed(jobs, e)
+            return
+        self._slots.release()
+        self.sent += len(jobs)
+        self.batches += 1
+        self.last_lag_ms = round((time.monotonic() - min(j.enqueued_at for j in jobs)) * 1000, 1)
+        if self.on_sent:
+            self.on_sent(tag)
+
+    def _add_batch(self, tag: str, jobs: list):
+        if len(jobs) == 1:
+            job = jobs[0]
+            self.client.add(content=job.content, container_tag=tag, custom_id=job.custom_id, metadata=job.metadata)
+            return
+        self.client.documents.batch_add(
+            container_tag=tag,
+            documents=[{"content": j.content, "custom_id": j.custom_id, "metadata": j.metadata} for j in jobs],
+        )
+
+    async def _failed(self, jobs: list, error: Exception):
+        retry, dead = [], []
+        for job in jobs:
+            job.attempts += 1
+            job.error = str(error)[:500]
+            (dead if job.attempts >= SM_MAX_ATTEMPTS else retry).append(job)
+        if dead:
+            await self._dead_letter(dead)
+        if not retry:
+            return
+        attempts = max(j.attempts for j in retry)
+        delay = min(SM_BACKOFF_MAX, SM_BACKOFF_BASE * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        self.retries += len(retry)
+        logger.warning(f"SuperMemory ingest failed for {len(retry)} docs (attempt {attempts}), retrying in {delay:.1f}s: {error}")
+        self._retrying += len(retry)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self._retrying -= len(retry)
+            # Back to the front of the queue, ahead of newer work (also on shutdown, so stop() sees them)
+            self._queue.extendleft(reversed(retry))
+            self._wake.set()
+
+    async def _dead_letter(self, jobs: list):
+        self.dead_lettered += len(jobs)
+        now = datetime.now(timezone.utc).isoformat()
+        docs = [{
+            "custom_id": j.custom_id,
+            "container_tag": j.container_tag,
+            "content": j.content,
+            "metadata": j.metadata,
+            "attempts": j.attempts,
+            "error": j.error,
+            "dead_at": now,
+        } for j in jobs]
+        try:
+            await self.db.sm_dead_letters.insert_many(docs)
+            logger.error(f"SuperMemory ingest dead-lettered {len(docs)} docs: {jobs[0].error}")
+        except Exception as e:
+            logger.error(f"SuperMemory dead-letter write failed, {len(docs)} docs lost: {e}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Deliver what we can within `timeout`, dead-letter the rest"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        deadline = time.monotonic() + timeout
+        await self._dispatch()
+        if self._sending:
+            await asyncio.wait(list(self._sending), timeout=max(0.0, deadline - time.monotonic()))
+        for task in list(self._sending):
+            task.cancel()  # backoff sleeps put their jobs back on the queue
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+        leftover = list(self._queue)
+        self._queue.clear()
+        if leftover:
+            for job in leftover:
+                job.error = job.error or "shutdown before delivery"
+            await self._dead_letter(leftover)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        oldest = self._queue[0].enqueued_at if self._queue else None
+        return {
+            "depth": len(self._queue),
+            "retrying": self._retrying,
+            "in_flight": len(self._sending),
+            "oldest_queued_s": round(time.monotonic() - oldest, 1) if oldest is not None else 0.0,
+            "last_lag_ms": self.last_lag_ms,
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "batches": self.batches,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+        }
+
+
+# Singleton instance
+_worker: Optional[SuperMemoryIngestWorker] = None
+
+
+def get_sm_worker(client, db) -> SuperMemoryIngestWorker:
+    """Get or create the SuperMemory ingestion worker singleton"""
+    global _worker
+    if _worker is None:
+        _worker = SuperMemoryIngestWorker(client, db)
+    return _worker
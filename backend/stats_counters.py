@@ -0,0 +1,116 @@
+"""
+Stats Counters for Sam
+======================
+Running totals behind /api/stats. Writers bump a counter document alongside
+each insert or delete, so the admin dashboard reads a handful of tiny
+documents instead of counting whole collections. A background job recounts
+everything periodically to correct any drift (a crashed writer, a manual
+edit in the shell, a racing bump during the recount itself).
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_INTERVAL = int(os.environ.get("STATS_RECONCILE_INTERVAL", str(15 * 60)))
+STATS_SNAPSHOT_TTL = float(os.environ.get("STATS_SNAPSHOT_TTL", "5"))
+
+# counter name -> (collection, filter) used when reconciling
+COUNTED = {
+    "messages": ("messages", {}),
+    "memories": ("memories", {}),
+    "sessions": ("sessions", {"last_active": {"$gt": ""}}),
+    "weekly_reflections": ("weekly_reflections", {}),
+    "proactive_messages": ("proactive_messages", {}),
+}
+
+
+class StatsCounters:
+    """Counter documents in `stats_counters`, keyed by name, with a short in-process snapshot"""
+
+    def __init__(self, db):
+        self.db = db
+        self._snapshot: Optional[dict] = None
+        self._snapshot_at = 0.0
+
+    async def bump(self, name: str, n: int = 1):
+        if not n:
+            return
+        try:
+            await self.db.stats_counters.update_one(
+                {"_id": name},
+                {"$inc": {"count": n}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning(f"Stats counter bump failed for {name}: {e}")  # reconcile will catch up
+        if self._snapshot is not None and name in self._snapshot["counts"]:
+            self._snapshot["counts"][name] += n
+
+    async def reconcile(self) -> dict:
+        """Recount every tracked collection and overwrite the counters"""
+        now = datetime.now(timezone.utc).isoformat()
+        counts = {}
+        for name, (collection, query) in COUNTED.items():
+            counts[name] = await self.db[collection].count_documents(query)
+            await self.db.stats_counters.update_one(
+                {"_id": name},
+                {"$set": {"count": counts[name], "updated_at": now, "reconciled_at": now}},
+                upsert=True,
+            )
+        self._snapshot = None
+        logger.info(f"Stats counters reconciled: {counts}")
+        return counts
+
+    async def snapshot(self) -> dict:
+        """{"counts": {...}, "as_of": iso, "reconciled_at": iso} — at most STATS_SNAPSHOT_TTL seconds old"""
+        if self._snapshot is not None and time.monotonic() - self._snapshot_at < STATS_SNAPSHOT_TTL:
+            return self._snapshot
+        docs = await self.db.stats_counters.find({"_id": {"$in": list(COUNTED)}}).to_list(len(COUNTED))
+        if len(docs) < len(COUNTED):
+            await self.reconcile()
+            docs = await self.db.stats_counters.find({"_id": {"$in": list(COUNTED)}}).to_list(len(COUNTED))
+        counts = {name: 0 for name in COUNTED}
+        reconciled = []
+        for d in docs:
+            counts[d["_id"]] = max(0, d.get("count", 0))
+            if d.get("reconciled_at"):
+                reconciled.append(d["reconciled_at"])
+        self._snapshot = {
+            "counts": counts,
+            "as_of": datetime.now(timezone.utc).isoformat(),
+            "reconciled_at": min(reconciled) if reconciled else None,
+        }
+        self._snapshot_at = time.monotonic()
+        return self._snapshot
+
+    async def run(self, leases=None):
+        """Background reconcile loop (the first snapshot() seeds missing counters itself).
+        With a lease manager only one worker reconciles per interval; the lease is left to expire."""
+        while True:
+            await asyncio.sleep(STATS_RECONCILE_INTERVAL)
+            try:
+                if leases and not await leases.acquire("loop:stats-reconcile", ttl=STATS_RECONCILE_INTERVAL * 0.9):
+                    continue
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Stats reconcile error: {e}")
+
+
+# Singleton instance
+_counters: Optional[StatsCounters] = None
+
+
+def get_stats_counters(db) -> StatsCounters:
+    """Get or create the stats counters singleton"""
+    global _counters
+    if _counters is None:
+        _counters = StatsCounters(db)
+    return _counters
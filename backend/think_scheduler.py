@@ -0,0 +1,239 @@
+"""
+Heartbeat Thinking Scheduler for Sam
+====================================
+Replaces the walk-every-session thinking loop. Each session's next thinking
+time is kept on its registry document (`next_think_at`); a dispatcher picks
+up sessions that are due — most recently active first, except that any
+session already overdue by a whole interval goes ahead of them, longest
+overdue first, so a busy stretch can't starve older sessions — and a fixed
+pool of workers thinks about them concurrently.
+
+A session is claimed by moving its `next_think_at` forward with a
+compare-and-set before the LLM is called, so a crash mid-thought doesn't
+make it due again immediately and two dispatchers never pick the same slot.
+The next time is the interval ± THINK_JITTER, so sessions that became active
+together drift apart instead of thinking in lockstep.
+
+Sessions where the user hasn't said anything new aren't thought about at
+all. Each thought records the newest user message it saw (`think_user_at`,
+against the registry's `last_user_at`); a due session where the user has
+been silent since is pushed back with exponential backoff — 2x, 4x, ... up
+to THINK_MAX_BACKOFF times the interval — without touching a worker or the
+LLM. Sam's own messages (proactive check-ins) don't count. The user's first
+new message puts it back on the normal cadence: the registry update that
+records it pulls `next_think_at` in to at most one interval away and clears
+`think_idle` (see `on_activity`).
+
+Lag — how late a thought started against its intended time — is the health
+signal: if it grows, THINK_CONCURRENCY is too low for the number of active
+sessions.
+"""
+
+import os
+import random
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+THINK_INTERVAL = int(os.environ.get("THINK_INTERVAL", str(12 * 60)))
+THINK_CONCURRENCY = int(os.environ.get("THINK_CONCURRENCY", "4"))
+THINK_JITTER = float(os.environ.get("THINK_JITTER", "0.1"))
+THINK_ACTIVE_DAYS = int(os.environ.get("THINK_ACTIVE_DAYS", "3"))
+THINK_POLL_S = float(os.environ.get("THINK_POLL_S", "15"))
+THINK_MAX_BACKOFF = int(os.environ.get("THINK_MAX_BACKOFF", "16"))
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat()
+
+
+def _parse(ts: str) -> Optional[datetime]:
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+class ThinkScheduler:
+    """Due sessions → bounded worker pool, with per-session next_think_at in Mongo"""
+
+    def __init__(self, db, think: Callable[[str], Awaitable[dict]],
+                 interval: int = THINK_INTERVAL, concurrency: int = THINK_CONCURRENCY):
+        self.db = db
+        self.think = think
+        self.interval = interval
+        self.concurrency = concurrency
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+        self._tasks: list = []
+        self._wake = asyncio.Event()
+        self.thoughts = 0
+        self.skipped = 0
+        self.failures = 0
+        self.claim_conflicts = 0
+        self.dispatched = 0
+        self.idle_skips = 0
+        self.busy = 0
+        self.last_due = 0
+        self.starving = 0
+        self._lags: deque = deque(maxlen=500)  # seconds late, recent starts
+
+    def next_time(self, idle: int = 0) -> str:
+        """Interval ± jitter, doubled for each consecutive idle check (capped)"""
+        interval = self.interval * min(2 ** idle, THINK_MAX_BACKOFF)
+        spread = interval * THINK_JITTER
+        return _iso(datetime.now(timezone.utc) + timedelta(seconds=interval + random.uniform(-spread, spread)))
+
+    def on_activity(self) -> dict:
+        """Update operators for a session with new messages: backoff reset, due within one interval"""
+        return {"$min": {"next_think_at": self.next_time()}, "$set": {"think_idle": 0}}
+
+    @staticmethod
+    def _last_user(row: dict) -> str:
+        return row.get("last_user_at", "")
+
+    # ── dispatch ─────────────────────────────────────────────
+    async def _due(self, limit: int) -> list:
+        """Starving sessions (overdue by an interval or more) oldest first, then the rest by recency"""
+        now = datetime.now(timezone.utc)
+        active_since = _iso(now - timedelta(days=THINK_ACTIVE_DAYS))
+        starving_before = _iso(now - timedelta(seconds=self.interval))
+        fields = {"_id": 0, "session_id": 1, "next_think_at": 1, "last_active": 1,
+                  "last_user_at": 1, "think_user_at": 1, "think_idle": 1}
+        rows = await self.db.sessions.find(
+            {"last_active": {"$gte": active_since}, "next_think_at": {"$lte": starving_before}}, fields,
+        ).sort("next_think_at", 1).limit(limit).to_list(limit)
+        self.starving = len(rows)
+        room = limit - len(rows)
+        if room > 0:
+            rows += await self.db.sessions.find(
+                {
+                    "last_active": {"$gte": active_since},
+                    "$or": [{"next_think_at": {"$gt": starving_before, "$lte": _iso(now)}},
+                            {"next_think_at": {"$exists": False}}],
+                },
+                fields,
+            ).sort("last_active", -1).limit(room).to_list(room)
+        return rows
+
+    def _idle(self, row: dict) -> bool:
+        """The user hasn't said anything since the last thought"""
+        return "think_user_at" in row and self._last_user(row) <= row["think_user_at"]
+
+    async def _claim(self, row: dict, idle: bool) -> bool:
+        """Move next_think_at forward iff nobody else has since we read it"""
+        if idle:
+            update = {"$set": {"next_think_at": self.next_time(row.get("think_idle", 0) + 1)}, "$inc": {"think_idle": 1}}
+        else:
+            update = {"$set": {"next_think_at": self.next_time(), "think_idle": 0}}
+        result = await self.db.sessions.update_one(
+            {"_id": row["session_id"], "next_think_at": row.get("next_think_at", {"$exists": False})},
+            update,
+        )
+        if result.modified_count != 1:
+            self.claim_conflicts += 1
+            return False
+        return True
+
+    async def _dispatch(self):
+        await asyncio.sleep(60)  # first thoughts a minute after startup
+        while True:
+            try:
+                room = self._queue.maxsize - self._queue.qsize()
+                # Claimed sessions are no longer due, so nothing queued or in flight comes back
+                due = await self._due(room) if room > 0 else []
+                self.last_due = len(due)
+                for row in due:
+                    idle = self._idle(row)
+                    if not await self._claim(row, idle):
+                        continue
+                    if idle:
+                        self.idle_skips += 1
+                        continue
+                    self.dispatched += 1
+                    self._queue.put_nowait((row["session_id"], row.get("next_think_at"), self._last_user(row)))
+            except Exception as e:
+                logger.error(f"Think scheduler dispatch error: {e}")
+            # Sleep until the poll interval passes or a worker frees up with more waiting
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=THINK_POLL_S)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            session_id, scheduled, last_user = await self._queue.get()
+            self.busy += 1
+            scheduled_at = _parse(scheduled) if scheduled else None
+            if scheduled_at:
+                self._lags.append(max(0.0, (datetime.now(timezone.utc) - scheduled_at).total_seconds()))
+            try:
+                result = await self.think(session_id)
+                if (result or {}).get("skipped"):
+                    self.skipped += 1
+                else:
+                    self.thoughts += 1
+                    await self.db.sessions.update_one({"_id": session_id}, {"$max": {"think_user_at": last_user}})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Thinking error for {session_id}: {e}")
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+                if self.last_due:
+                    self._wake.set()  # there was a backlog; refill now rather than at the next poll
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._dispatch())]
+            self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+            logger.info(f"Think scheduler started — every ~{self.interval // 60}min, {self.concurrency} at a time")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        lags = sorted(self._lags)
+        checked = self.idle_skips + self.dispatched
+        return {
+            "interval_s": self.interval,
+            "concurrency": self.concurrency,
+            "busy": self.busy,
+            "queued": self._queue.qsize(),
+            "last_due": self.last_due,
+            "starving": self.starving,
+            "thoughts": self.thoughts,
+            "skipped": self.skipped,
+            "failures": self.failures,
+            "claim_conflicts": self.claim_conflicts,
+            "idle_skips": self.idle_skips,
+            "idle_skip_rate": round(self.idle_skips / checked, 3) if checked else 0.0,
+            "lag_s": {
+                "p50": round(lags[len(lags) // 2], 1) if lags else 0.0,
+                "p95": round(lags[int(len(lags) * 0.95)], 1) if lags else 0.0,
+                "max": round(lags[-1], 1) if lags else 0.0,
+                "last": round(self._lags[-1], 1) if lags else 0.0,
+            },
+        }
+
+
+# Singleton instance
+_scheduler: Optional[ThinkScheduler] = None
+
+
+def get_think_scheduler(db, think: Callable[[str], Awaitable[dict]]) -> ThinkScheduler:
+    """Get or create the thinking scheduler singleton"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ThinkScheduler(db, think)
+    return _scheduler
@@ -0,0 +1,241 @@
+"""
+TTS Audio Cache for Sam
+=======================
+Content-addressed cache in front of speech synthesis. Sam repeats herself more
+than you'd think — fallback lines, replayed proactive messages, the garden
+summary — so identical requests are served from an in-memory LRU tier backed
+by a size-bounded directory on disk, and concurrent identical requests share a
+single upstream call.
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_DIR = Path(os.environ.get("TTS_CACHE_DIR", Path(__file__).parent / ".tts_cache"))
+TTS_CACHE_MEMORY_MB = int(os.environ.get("TTS_CACHE_MEMORY_MB", "64"))
+TTS_CACHE_DISK_MB = int(os.environ.get("TTS_CACHE_DISK_MB", "512"))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class TTSCache:
+    """Two-tier (memory LRU + disk) MP3 cache with singleflight upstream calls"""
+
+    def __init__(self, cache_dir: Path, memory_bytes: int, disk_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_size = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_size = sum(p.stat().st_size for p in self.cache_dir.glob("*.mp3"))
+        except OSError as e:
+            logger.warning(f"TTS disk cache unavailable ({e}), memory tier only")
+            self.disk_bytes = 0
+
+    @staticmethod
+    def key(voice_id: str, model_id: str, text: str, settings: tuple) -> str:
+        """Content address for one synthesis request"""
+        raw = json.dumps([voice_id, model_id, text, list(settings)], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ── memory tier ──────────────────────────────────────────
+    def _memory_get(self, key: str) -> Optional[bytes]:
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+        return audio
+
+    def _memory_put(self, key: str, audio: bytes):
+        if len(audio) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = audio
+        self._memory_size += len(audio)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    # ── disk tier ────────────────────────────────────────────
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.mp3"
+
+    def _disk_get(self, key: str) -> Optional[bytes]:
+        if not self.disk_bytes:
+            return None
+        path = self._path(key)
+        try:
+            audio = path.read_bytes()
+            os.utime(path)  # mtime doubles as LRU clock for eviction
+            return audio
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, audio: bytes):
+        if not self.disk_bytes or len(audio) > self.disk_bytes:
+            return
+        path = self._path(key)
+        tmp = path.with_suffix(".tmp")
+        try:
+            replaced = path.stat().st_size if path.exists() else 0
+            tmp.write_bytes(audio)
+            tmp.replace(path)
+            self._disk_size += len(audio) - replaced
+        except OSError as e:
+            logger.warning(f"TTS disk cache write failed: {e}")
+            return
+        if self._disk_size > self.disk_bytes:
+            self._disk_evict()
+
+    def _disk_evict(self):
+        files = []
+        for p in self.cache_dir.glob("*.mp3"):
+            try:
+                st = p.stat()
+                files.append((st.st_mtime, st.st_size, p))
+            except OSError:
+                continue
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        # Trim to 90% so we don't rescan the directory on every write
+        target = int(self.disk_bytes * 0.9)
+        for _, size, p in files:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        self._disk_size = total
+
+    # ── public API ───────────────────────────────────────────
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._memory_get(key)
+        if audio is not None:
+            self.hits_memory += 1
+            return audio
+        audio = await asyncio.to_thread(self._disk_get, key)
+        if audio is not None:
+            self.hits_disk += 1
+            self._memory_put(key, audio)
+        return audio
+
+    async def put(self, key: str, audio: bytes):
+        self._memory_put(key, audio)
+        await asyncio.to_thread(self._disk_put, key, audio)
+
+    async def stream(
+        self,
+        key: str,
+        open_upstream: Callable[[], Awaitable[AsyncIterator[bytes]]],
+    ) -> AsyncIterator[bytes]:
+        """
+        Return an iterator over the audio for `key`.
+
+        Served from cache when possible. Otherwise, if an identical request is
+        already in flight its result is shared; failing that, `open_upstream` is
+        called and its chunks are passed through while being recorded. Errors
+        from `open_upstream` propagate so the caller can fall back.
+        """
+        audio = await self.get(key)
+        if audio is not None:
+            return _iter_bytes(audio)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                audio = await asyncio.wait_for(asyncio.shield(inflight), timeout=30)
+                self.coalesced += 1
+                return _iter_bytes(audio)
+            except Exception:
+                pass  # the leader failed; try upstream ourselves
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            chunks = await open_upstream()
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        return self._record(key, future, chunks)
+
+    async def _record(self, key: str, future: asyncio.Future, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        parts = []
+        try:
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        audio = b"".join(parts)
+        self._settle(key, future, audio=audio)
+        if audio:
+            await self.put(key, audio)
+
+    def _settle(self, key: str, future: asyncio.Future, audio: bytes = None, error: BaseException = None):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error if isinstance(error, Exception) else RuntimeError("synthesis aborted"))
+            future.exception()  # mark retrieved; followers may not exist
+        else:
+            future.set_result(audio)
+
+    def stats(self) -> dict:
+        hits = self.hits_memory + self.hits_disk + self.coalesced
+        lookups = hits + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_size,
+            "disk_bytes": self._disk_size,
+            "inflight": len(self._inflight),
+        }
+
+
+async def _iter_bytes(audio: bytes) -> AsyncIterator[bytes]:
+    for i in range(0, len(audio), CHUNK_SIZE):
+        yield audio[i:i + CHUNK_SIZE]
+
+
+# Singleton instance
+_cache: Optional[TTSCache] = None
+
+
+def get_tts_cache() -> TTSCache:
+    """Get or create the TTS cache singleton"""
+    global _cache
+    if _cache is None:
+        _cache = TTSCache(
+            TTS_CACHE_DIR,
+            memory_bytes=TTS_CACHE_MEMORY_MB * 1024 * 1024,
+            disk_bytes=TTS_CACHE_DISK_MB * 1024 * 1024,
+        )
+    return _cache
@@ -0,0 +1,429 @@
+"""
+Memory Vector Index for Sam
+===========================
+In-process cosine search over each session's memories, so recall doesn't
+need a network round trip (and still works with no SuperMemory key at all).
+
+Memories are embedded locally with a feature-hashing embedder — word
+unigrams, bigrams and character n-grams hashed into a fixed number of signed
+buckets. It needs no model download and is deterministic, so vectors can be
+persisted and reused across restarts. Embeddings are cached by content hash.
+
+Each session's matrix lives in memory (LRU across sessions), is updated
+incrementally as memories are written, and is saved to VECTOR_INDEX_DIR as
+one .npz per session. On load, and every VECTOR_RESYNC_S after, the index
+catches up with Mongo whenever the session's `versions.memories` has moved
+(see change_versions.py): memories it doesn't have are added, memories
+compaction archived are dropped, and compaction's reweighting is picked up.
+That covers writes from other workers and digests, whose timestamps are
+back-dated to the day they summarize.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import zlib
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_DIR = Path(os.environ.get("VECTOR_INDEX_DIR", Path(__file__).parent / ".vector_index"))
+VECTOR_DIM = int(os.environ.get("VECTOR_DIM", "2048"))
+VECTOR_INDEX_SESSIONS = int(os.environ.get("VECTOR_INDEX_SESSIONS", "200"))
+VECTOR_EMBED_CACHE = int(os.environ.get("VECTOR_EMBED_CACHE", "20000"))
+VECTOR_MIN_SCORE = float(os.environ.get("VECTOR_MIN_SCORE", "0.18"))
+VECTOR_RESYNC_S = int(os.environ.get("VECTOR_RESYNC_S", "300"))
+VECTOR_SAVE_INTERVAL = int(os.environ.get("VECTOR_SAVE_INTERVAL", "30"))
+VECTOR_BACKLOG = int(os.environ.get("VECTOR_BACKLOG", "32"))
+
+_WORD = re.compile(r"[a-z0-9']+")
+_STOPWORDS = frozenset(
+    "a an the and or but if of to in on at for with by from is are was were be been am i me my you your "
+    "it its this that these those we our they them their he she his her so as do did does have has had "
+    "not no just really very can could would should will about what when how there here".split()
+)
+# Sam's own prefixes carry no meaning for recall
+_PREFIX = re.compile(r"^\[[^\]]*\]:\s*|^(user's name/identity|emotional state shared|sam's reflection):\s*", re.I)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words, word pairs and character 4-grams, L2-normalised"""
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+        self.name = f"hashing-v1-{dim}"
+
+    def features(self, text: str) -> dict:
+        words = [w.strip("'") for w in _WORD.findall(_PREFIX.sub("", text.lower()))]
+        words = [w for w in words if w and w not in _STOPWORDS]
+        feats: dict = {}
+
+        def add(f: str, w: float):
+            feats[f] = feats.get(f, 0.0) + w
+
+        for w in words:
+            add("w:" + w, 1.0)
+            padded = f"<{w}>"
+            for i in range(len(padded) - 3):
+                add("c:" + padded[i:i + 4], 0.35)
+        for a, b in zip(words, words[1:]):
+            add(f"b:{a} {b}", 0.6)
+        return feats
+
+    def embed(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for f, w in self.features(text).items():
+            h = zlib.crc32(f.encode("utf-8"))
+            # Sublinear term weight; the top hash bit picks the sign so collisions tend to cancel
+            weight = 1.0 + math.log(w) if w > 1 else w
+            vec[h % self.dim] += -weight if h & 0x80000000 else weight
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else vec
+
+
+class _SessionIndex:
+    """Growable matrix of unit vectors plus the memory fields recall needs"""
+
+    def __init__(self, dim: int):
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.size = 0
+        self.ids: list = []
+        self.known: set = set()
+        self.docs: list = []  # {"id", "content", "category", "timestamp", "weight"}
+        self.version = -1      # versions.memories last reconciled against
+        self.checked_at = 0.0  # monotonic time of the last catch-up with Mongo
+        self.dirty = False
+        self.lock = asyncio.Lock()
+
+    def append(self, rows: np.ndarray, docs: list):
+        if not docs:
+            return
+        need = self.size + len(docs)
+        if need > len(self.vectors):
+            grown = np.zeros((max(need, 2 * len(self.vectors), 16), self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+        self.vectors[self.size:need] = rows
+        self.size = need
+        self.ids.extend(d["id"] for d in docs)
+        self.known.update(d["id"] for d in docs)
+        self.docs.extend(docs)
+        self.dirty = True
+
+    def remove(self, ids: set) -> int:
+        keep = [i for i, mid in enumerate(self.ids) if mid not in ids]
+        removed = self.size - len(keep)
+        if removed:
+            self.vectors = self.vectors[keep].copy()
+            self.size = len(keep)
+            self.ids = [self.ids[i] for i in keep]
+            self.known = set(self.ids)
+            self.docs = [self.docs[i] for i in keep]
+            self.dirty = True
+        return removed
+
+
+def _slim(memory: dict) -> dict:
+    return {
+        "id": memory["id"],
+        "content": memory.get("content", ""),
+        "category": memory.get("category", ""),
+        "timestamp": memory.get("timestamp", ""),
+        "weight": memory.get("weight", 1.0),
+    }
+
+
+class MemoryVectorIndex:
+    """Per-session cosine search over db.memories"""
+
+    def __init__(self, db, directory: Path = VECTOR_INDEX_DIR, embedder: HashingEmbedder = None,
+                 max_sessions: int = VECTOR_INDEX_SESSIONS):
+        self.db = db
+        self.directory = Path(directory)
+        self.embedder = embedder or HashingEmbedder()
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionIndex]" = OrderedDict()
+        # session_id -> memories written while the session wasn't loaded. Only the
+        # write-behind window matters (anything flushed is caught up from Mongo),
+        # so it's bounded per session and across sessions.
+        self._backlog: "OrderedDict[str, deque]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.searches = 0
+        self.search_ms = 0.0
+        self.embed_hits = 0
+        self.embed_misses = 0
+        self.loads_disk = 0
+        self.loads_db = 0
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Vector index directory unavailable ({e}), indexes will not persist")
+
+    # ── embeddings ───────────────────────────────────────────
+    @staticmethod
+    def _content_key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _cached(self, key: str) -> Optional[np.ndarray]:
+        vec = self._embeddings.get(key)
+        if vec is not None:
+            self._embeddings.move_to_end(key)
+            self.embed_hits += 1
+        return vec
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self.embed_misses += 1
+        self._embeddings[key] = vec
+        if len(self._embeddings) > VECTOR_EMBED_CACHE:
+            self._embeddings.popitem(last=False)
+
+    def embed(self, text: str) -> np.ndarray:
+        key = self._content_key(text)
+        vec = self._cached(key)
+        if vec is None:
+            vec = self.embedder.embed(text)
+            self._remember(key, vec)
+        return vec
+
+    async def embed_many(self, texts: list) -> np.ndarray:
+        """Embed a batch; cache misses are computed off the event loop"""
+        rows = np.zeros((len(texts), self.embedder.dim), dtype=np.float32)
+        keys = [self._content_key(t) for t in texts]
+        missing = []
+        for i, key in enumerate(keys):
+            vec = self._cached(key)
+            if vec is None:
+                missing.append(i)
+            else:
+                rows[i] = vec
+        if missing:
+            fresh = await asyncio.to_thread(lambda: [self.embedder.embed(texts[i]) for i in missing])
+            for i, vec in zip(missing, fresh):
+                rows[i] = vec
+                self._remember(keys[i], vec)
+        return rows
+
+    # ── persistence ──────────────────────────────────────────
+    def _path(self, session_id: str) -> Path:
+        return self.directory / f"{hashlib.sha1(session_id.encode('utf-8')).hexdigest()}.npz"
+
+    def _read(self, session_id: str) -> Optional[_SessionIndex]:
+        path = self._path(session_id)
+        if not path.exists():
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["embedder"]) != self.embedder.name:
+                    return None  # different embedder — rebuild from Mongo
+                docs = json.loads(str(data["docs"]))
+                vectors = data["vectors"]
+                version = int(data["version"]) if "version" in data.files else -1
+        except Exception as e:
+            logger.warning(f"Vector index for {session_id} unreadable, rebuilding: {e}")
+            return None
+        index = _SessionIndex(self.embedder.dim)
+        index.append(vectors, docs)
+        index.version = version
+        index.dirty = False
+        return index
+
+    def _write(self, session_id: str, index: _SessionIndex):
+        path = self._path(session_id)
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez(
+            tmp,
+            embedder=np.array(self.embedder.name),
+            version=np.array(index.version),
+            vectors=index.vectors[:index.size],
+            docs=np.array(json.dumps(index.docs, ensure_ascii=False)),
+        )
+        tmp.replace(path)
+
+    async def save(self, session_id: str = None):
+        """Write dirty sessions (or just one) to disk"""
+        targets = [session_id] if session_id else list(self._sessions)
+        for sid in targets:
+            index = self._sessions.get(sid)
+            if index is None or not index.dirty:
+                continue
+            index.dirty = False
+            try:
+                await asyncio.to_thread(self._write, sid, index)
+            except Exception as e:
+                index.dirty = True
+                logger.warning(f"Vector index save failed for {sid}: {e}")
+
+    # ── loading ──────────────────────────────────────────────
+    async def _session(self, session_id: str) -> _SessionIndex:
+        index = self._sessions.get(session_id)
+        if index is None:
+            index = await asyncio.to_thread(self._read, session_id)
+            if index is not None:
+                self.loads_disk += 1
+            else:
+                index = _SessionIndex(self.embedder.dim)
+                self.loads_db += 1
+            if session_id in self._sessions:  # a concurrent caller got there first
+                index = self._sessions[session_id]
+            else:
+                self._sessions[session_id] = index
+                await self._evict()
+        self._sessions.move_to_end(session_id)
+
+        if time.monotonic() - index.checked_at > VECTOR_RESYNC_S:
+            async with index.lock:
+                if time.monotonic() - index.checked_at > VECTOR_RESYNC_S:
+                    await self._catch_up(session_id, index)
+        return index
+
+    async def _catch_up(self, session_id: str, index: _SessionIndex):
+        """Reconcile with Mongo if the session's memories changed since we last looked, then fold in the backlog"""
+        fresh = []
+        row = await self.db.sessions.find_one({"_id": session_id}, {"versions.memories": 1})
+        version = ((row or {}).get("versions") or {}).get("memories", 0)
+        if version != index.version:
+            fresh = await self._reconcile(session_id, index)
+            index.version = version  # read first: a change racing the reconcile is seen next time
+        fresh.extend(self._backlog.pop(session_id, []))
+        docs, seen = [], set()
+        for m in fresh:
+            if m.get("id") and m["id"] not in index.known and m["id"] not in seen:
+                seen.add(m["id"])
+                docs.append(_slim(m))
+        if docs:
+            rows = await self.embed_many([d["content"] for d in docs])
+            index.append(rows, docs)
+        index.checked_at = time.monotonic()
+
+    async def _reconcile(self, session_id: str, index: _SessionIndex) -> list:
+        """Apply archiving and reweighting to the index; returns the live memories it is missing"""
+        live = await self.db.memories.find(
+            {"session_id": session_id}, {"_id": 0, "id": 1, "weight": 1}
+        ).to_list(None)
+        weights = {m["id"]: m.get("weight", 1.0) for m in live if m.get("id")}
+        for doc in index.docs:
+            if doc["id"] in weights and doc["weight"] != weights[doc["id"]]:
+                doc["weight"] = weights[doc["id"]]
+                index.dirty = True
+        # Only archived ids are dropped: one missing from Mongo may still be in the write-behind buffer
+        gone = [mid for mid in index.ids if mid not in weights]
+        if gone:
+            archived = await self.db.memories_archive.find(
+                {"session_id": session_id, "id": {"$in": gone}}, {"_id": 0, "id": 1}
+            ).to_list(None)
+            index.remove({a["id"] for a in archived})
+        missing = [mid for mid in weights if mid not in index.known]
+        if not missing:
+            return []
+        return await self.db.memories.find(
+            {"id": {"$in": missing}}, {"_id": 0, "id": 1, "content": 1, "category": 1, "timestamp": 1, "weight": 1}
+        ).sort("timestamp", 1).to_list(None)
+
+    async def _evict(self):
+        while len(self._sessions) > self.max_sessions:
+            sid, index = next(iter(self._sessions.items()))
+            if index.dirty:
+                await self.save(sid)
+            self._sessions.pop(sid, None)
+
+    # ── public API ───────────────────────────────────────────
+    def add(self, session_id: str, memory: dict):
+        """Index a memory as it is written"""
+        index = self._sessions.get(session_id)
+        if index is None:
+            pending = self._backlog.pop(session_id, None) or deque(maxlen=VECTOR_BACKLOG)
+            pending.append(memory)
+            self._backlog[session_id] = pending
+            while len(self._backlog) > self.max_sessions:
+                self._backlog.popitem(last=False)
+            return
+        if memory["id"] in index.known:
+            return
+        index.append(self.embed(memory.get("content", ""))[None, :], [_slim(memory)])
+
+    def remove(self, session_id: str, ids) -> int:
+        """Drop memories (e.g. after compaction) from a session's index"""
+        index = self._sessions.get(session_id)
+        if index is None:
+            return 0
+        return index.remove(set(ids))
+
+    async def search(self, session_id: str, query: str, limit: int = 4,
+                     min_score: float = VECTOR_MIN_SCORE, exclude: set = None) -> list:
+        """Top `limit` memories by cosine similarity, as [(score, memory)] best first"""
+        index = await self._session(session_id)
+        started = time.perf_counter()
+        try:
+            if not index.size or not query.strip():
+                return []
+            scores = index.vectors[:index.size] @ self.embed(query)
+            k = min(index.size, limit + len(exclude or ()))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hits = []
+            for i in top:
+                if scores[i] < min_score:
+                    break
+                if exclude and index.ids[i] in exclude:
+                    continue
+                hits.append((float(scores[i]), index.docs[i]))
+                if len(hits) == limit:
+                    break
+            return hits
+        finally:
+            self.searches += 1
+            self.search_ms += (time.perf_counter() - started) * 1000
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(VECTOR_SAVE_INTERVAL)
+            try:
+                await self.save()
+            except Exception as e:
+                logger.error(f"Vector index save loop error: {e}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.save()
+
+    def stats(self) -> dict:
+        lookups = self.embed_hits + self.embed_misses
+        return {
+            "embedder": self.embedder.name,
+            "sessions": len(self._sessions),
+            "vectors": sum(i.size for i in self._sessions.values()),
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_ms / self.searches, 3) if self.searches else 0.0,
+            "embed_cache_hit_ratio": round(self.embed_hits / lookups, 3) if lookups else 0.0,
+            "loads_disk": self.loads_disk,
+            "loads_db": self.loads_db,
+            "backlog": sum(len(b) for b in self._backlog.values()),
+        }
+
+
+# Singleton instance
+_index: Optional[MemoryVectorIndex] = None
+
+
+def get_vector_index(db) -> MemoryVectorIndex:
+    """Get or create the memory vector index singleton"""
+    global _index
+    if _index is None:
+        _index = MemoryVectorIndex(db)
+    return _index
@@ -0,0 +1,185 @@
+"""
+Write-Behind Persistence for Sam
+================================
+Chat turns and extracted memories are queued here instead of being inserted
+inline, so the reply reaches the user before MongoDB is touched. Queued
+documents are batched across turns into one insert_many per collection,
+flushed when a batch fills up or the flush interval passes, and drained on
+shutdown.
+
+Until a document lands, `pending()` hands it back to readers so a session
+always sees its own writes.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BATCH = int(os.environ.get("WRITE_BEHIND_BATCH", "200"))
+WRITE_BEHIND_FLUSH_MS = int(os.environ.get("WRITE_BEHIND_FLUSH_MS", "250"))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "5000"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.environ.get("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+
+DUPLICATE_KEY = 11000
+
+FlushHook = Callable[[List[dict]], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """Per-collection insert buffers flushed in the background"""
+
+    def __init__(self, db, batch_size: int = WRITE_BEHIND_BATCH, flush_ms: int = WRITE_BEHIND_FLUSH_MS,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self._buffers: Dict[str, List[dict]] = {}
+        self._inflight: Dict[str, List[dict]] = {}
+        self._attempts: Dict[tuple, int] = {}  # (collection, doc id) -> failed flushes
+        self._hooks: Dict[str, List[FlushHook]] = {}
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def on_flush(self, collection: str, hook: FlushHook):
+        """Run `hook(docs)` after documents for `collection` have been inserted"""
+        self._hooks.setdefault(collection, []).append(hook)
+
+    def depth(self) -> int:
+        return sum(len(b) for b in self._buffers.values()) + sum(len(b) for b in self._inflight.values())
+
+    async def put(self, collection: str, *docs: dict):
+        """Queue documents for insertion. Only waits when the backlog is over max_pending."""
+        buf = self._buffers.setdefault(collection, [])
+        buf.extend({**d} for d in docs)  # copies: insert_many stamps _id onto them
+        if len(buf) >= self.batch_size:
+            self._wake.set()
+        if self._task is None:
+            await self.flush()  # not started (scripts, tests) — behave like a plain insert
+        elif self.depth() > self.max_pending:
+            await self.flush()
+
+    def pending(self, collection: str, session_id: str) -> List[dict]:
+        """Queued or in-flight documents for a session, oldest first"""
+        docs = self._inflight.get(collection, []) + self._buffers.get(collection, [])
+        return [{k: v for k, v in d.items() if k != "_id"} for d in docs if d.get("session_id") == session_id]
+
+    async def flush(self):
+        async with self._flush_lock:
+            for collection in list(self._buffers):
+                batch = self._buffers.pop(collection, [])
+                while batch:
+                    chunk, batch = batch[:self.batch_size], batch[self.batch_size:]
+                    await self._flush_chunk(collection, chunk)
+
+    async def _flush_chunk(self, collection: str, docs: List[dict]):
+        self._inflight[collection] = docs
+        written, retry = docs, []
+        try:
+            await self.db[collection].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate _id means an earlier attempt already landed that document
+            failed = {err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY}
+            retry = [d for i, d in enumerate(docs) if i in failed]
+            written = [d for i, d in enumerate(docs) if i not in failed]
+            if failed:
+                self.failures += 1
+                logger.warning(f"Write-behind: {len(failed)}/{len(docs)} {collection} inserts failed")
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Write-behind flush of {len(docs)} {collection} docs failed: {e}")
+            written, retry = [], docs
+        finally:
+            self._inflight.pop(collection, None)
+
+        self._requeue(collection, retry)
+        for d in written:
+            self._attempts.pop((collection, d.get("id")), None)
+        if not written:
+            return
+        self.flushed += len(written)
+        self.batches += 1
+        for hook in self._hooks.get(collection, []):
+            try:
+                await hook(written)
+            except Exception as e:
+                logger.warning(f"Write-behind hook for {collection} failed: {e}")
+
+    def _requeue(self, collection: str, docs: List[dict]):
+        keep = []
+        for d in docs:
+            key = (collection, d.get("id"))
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts >= WRITE_BEHIND_MAX_ATTEMPTS:
+                self._attempts.pop(key, None)
+                self.dropped += 1
+                logger.error(f"Write-behind gave up on {collection} doc {d.get('id')} after {attempts} attempts")
+            else:
+                self._attempts[key] = attempts
+                keep.append(d)
+        if keep:
+            self._buffers[collection] = keep + self._buffers.get(collection, [])
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind loop error: {e}")
+
+    async def drain(self):
+        """Stop the background loop and write out everything still queued"""
+        if self._task:
+            # Let the loop finish the batch it is on rather than cancelling mid-insert
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        for _ in range(WRITE_BEHIND_MAX_ATTEMPTS):
+            if not self.depth():
+                break
+            await self.flush()
+        if self.depth():
+            logger.error(f"Write-behind drained with {self.depth()} documents unwritten")
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth(),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+# Singleton instance
+_queue: Optional[WriteBehindQueue] = None
+
+
+def get_write_behind(db) -> WriteBehindQueue:
+    """Get or create the write-behind queue singleton"""
+    global _queue
+    if _queue is None:
+        _queue = WriteBehindQueue(db)
+    return _queue
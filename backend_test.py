@@ -166,6 +166,33 @@ class SamAPITester:
                 
         return success
 
+    def test_chat_stream(self):
+        """Test SSE chat endpoint streams deltas and ends with a done event"""
+        url = f"{self.base_url}/chat/stream"
+        self.tests_run += 1
+        print(f"\n🔍 Test {self.tests_run}: Streaming Chat (SSE)")
+        print(f"   POST chat/stream")
+
+        try:
+            events = []
+            with requests.post(url, json={"session_id": self.session_id, "message": "Say something short."},
+                               stream=True, timeout=30) as response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if line and line.startswith("event: "):
+                        events.append(line[len("event: "):])
+            if response.status_code == 200 and events and events[-1] == "done" and "delta" in events:
+                self.tests_passed += 1
+                print(f"   ✅ PASS - {events.count('delta')} delta events, then done")
+                return True
+            error_msg = f"Status: {response.status_code}, events: {events[-3:]}"
+            print(f"   ❌ FAIL - {error_msg}")
+            self.failed_tests.append(f"Streaming Chat (SSE): {error_msg}")
+            return False
+        except Exception as e:
+            print(f"   ❌ FAIL - Error: {str(e)}")
+            self.failed_tests.append(f"Streaming Chat (SSE): {str(e)}")
+            return False
+
     def test_tts_functionality(self):
         """Test TTS endpoint with ElevenLabs integration"""
         test_text = "Hi there! I've been thinking about you. Tell me something — how are you feeling right now?"
@@ -218,13 +245,53 @@ class SamAPITester:
         if get_success:
             initial_count = len(data) if data else 0
             print(f"   📨 Found {initial_count} existing messages")
-            
+
+            self.test_message_cursors(initial_count)
+
             # Test message deletion
             delete_success, _ = self.run_test("Clear Messages", "DELETE", f"messages/{self.session_id}")
             return delete_success
             
         return get_success
 
+    def test_message_cursors(self, total):
+        """Test paged messages: newest page, `before` the older cursor, and an empty `since` delta"""
+        success, page = self.run_test("Get Messages (paged)", "GET", f"messages/{self.session_id}?paged=true&limit=1")
+        if not success:
+            return False
+
+        def check(name, ok, detail):
+            self.tests_run += 1
+            print(f"\n🔍 Test {self.tests_run}: {name}")
+            if ok:
+                self.tests_passed += 1
+                print(f"   ✅ PASS - {detail}")
+            else:
+                print(f"   ❌ FAIL - {detail}")
+                self.failed_tests.append(f"{name}: {detail}")
+            return ok
+
+        messages = page.get("messages", [])
+        ok = check("Paged Shape", set(page) >= {"messages", "older", "newest", "has_more"}
+                   and len(messages) == min(total, 1) and page["has_more"] == (total > 1),
+                   f"{len(messages)} message(s), has_more={page.get('has_more')}, of {total}")
+
+        if page.get("older"):
+            success, older = self.run_test("Get Messages (before cursor)", "GET",
+                                           f"messages/{self.session_id}?before={page['older']}&limit=1")
+            previous = older.get("messages", [])
+            ok &= success and check("Before Cursor Pages Back", len(previous) == 1 and
+                                    (previous[0]["timestamp"], previous[0]["id"]) <
+                                    (messages[0]["timestamp"], messages[0]["id"]),
+                                    f"older message {previous[0]['id'] if previous else None}")
+
+        if page.get("newest"):
+            success, delta = self.run_test("Get Messages (since newest)", "GET",
+                                           f"messages/{self.session_id}?since={page['newest']}")
+            ok &= success and check("Since Newest Is Empty", delta.get("messages") == [] and not delta.get("has_more"),
+                                    f"{len(delta.get('messages', []))} new message(s)")
+        return ok
+
     def test_weekly_reflections(self):
         """Test weekly reflection generation"""
         return self.run_test(
@@ -320,6 +387,7 @@ class SamAPITester:
             ("System Statistics", self.test_stats_endpoint),
             ("Voice List (ElevenLabs)", self.test_voices_endpoint),
             ("Chat with GPT-4o", self.test_chat_functionality),
+            ("Streaming Chat (SSE)", self.test_chat_stream),
             ("SuperMemory Search", self.test_supermemory_search),
             ("Chat with SuperMemory Enrichment", self.test_chat_with_supermemory_enrichment),
             ("TTS Audio Generation", self.test_tts_functionality),
@@ -138,16 +138,35 @@ export default function MemoryGarden({ sessionId }) {
   const animRef    = useRef(null);
   const nodesRef   = useRef([]);
   const linksRef   = useRef([]);
+  const graphRef   = useRef({ version: null, nodes: [], links: [] });
 
   /* ── fetch data ── */
   const fetchData = useCallback(async () => {
     setIsLoading(true);
     try {
+      const known = graphRef.current.version;
       const [graphRes, memRes] = await Promise.all([
-        axios.get(`${API}/memories/${sessionId}/graph`),
+        axios.get(`${API}/memories/${sessionId}/graph`, { params: known != null ? { semantic: true, since: known } : { semantic: true } }),
         axios.get(`${API}/memories/${sessionId}`)
       ]);
-      setGraphData(graphRes.data);
+      const g = graphRes.data;
+      if (known == null || g.full) {
+        graphRef.current = g;
+        setGraphData(g);
+      } else if (g.version !== known) {
+        // Delta: drop removed/replaced nodes (and their links), then add the new ones
+        const gone = new Set([...g.removed, ...g.nodes.map(n => n.id)]);
+        const cut = new Set((g.removed_links || []).map(([a, b]) => `${a}|${b}`));
+        const keep = l => !gone.has(l.source) && !gone.has(l.target)
+          && !(l.type === 'semantic' && (cut.has(`${l.source}|${l.target}`) || cut.has(`${l.target}|${l.source}`)));
+        const next = {
+          version: g.version,
+          nodes: [...graphRef.current.nodes.filter(n => !gone.has(n.id)), ...g.nodes],
+          links: [...graphRef.current.links.filter(keep), ...g.links],
+        };
+        graphRef.current = next;
+        setGraphData(next);
+      }
       setMemories(memRes.data);
     } catch (e) {
       toast.error('Could not load memory garden');
@@ -156,7 +175,10 @@ export default function MemoryGarden({ sessionId }) {
     }
   }, [sessionId]);
 
-  useEffect(() => { fetchData(); }, [fetchData]);
+  useEffect(() => {
+    graphRef.current = { version: null, nodes: [], links: [] };
+    fetchData();
+  }, [fetchData]);
 
   /* ── stats derived ── */
   const stats = useMemo(() => {
@@ -39,6 +39,7 @@ export default function SamPage({ sessionId }) {
   const wsRef = useRef(null);
   const spaceHeldRef = useRef(false);
   const isMountedRef = useRef(true);
+  const newestCursorRef = useRef(null);
 
   useEffect(() => {
     isMountedRef.current = true;
@@ -60,6 +61,7 @@ export default function SamPage({ sessionId }) {
       ws.onopen = () => {
         if (isMountedRef.current) setWsConnected(true);
         ws.send(JSON.stringify({ action: 'ping' }));
+        syncMessages(); // pick up anything written while we were away
       };
 
       ws.onmessage = (event) => {
@@ -127,13 +129,15 @@ export default function SamPage({ sessionId }) {
     }
   }, [isTTSEnabled]);
 
-  // Load existing messages
+  // Load the latest page of messages
   useEffect(() => {
+    newestCursorRef.current = null;
     const loadMessages = async () => {
       try {
-        const res = await axios.get(`${API}/messages/${sessionId}?limit=50`);
-        if (res.data.length > 0) {
-          setMessages(res.data);
+        const res = await axios.get(`${API}/messages/${sessionId}`, { params: { limit: 50, paged: true } });
+        newestCursorRef.current = res.data.newest;
+        if (res.data.messages.length > 0) {
+          setMessages(res.data.messages.slice().reverse());
           setHasGreeted(true);
         }
       } catch (e) {}
@@ -141,6 +145,26 @@ export default function SamPage({ sessionId }) {
     loadMessages();
   }, [sessionId]);
 
+  // Reconnect delta: only the messages after the newest one we've seen
+  const syncMessages = useCallback(async () => {
+    if (!newestCursorRef.current) return;
+    try {
+      let fresh = [], hasMore = true;
+      while (hasMore) {
+        const res = await axios.get(`${API}/messages/${sessionId}`, { params: { since: newestCursorRef.current, limit: 200 } });
+        newestCursorRef.current = res.data.newest;
+        fresh = fresh.concat(res.data.messages);
+        hasMore = res.data.has_more;
+      }
+      if (fresh.length === 0 || !isMountedRef.current) return;
+      setMessages(prev => {
+        // Turns sent from this tab are already on screen under client-side ids
+        const seen = new Set(prev.map(m => m.id).concat(prev.slice(-50).map(m => `${m.role}|${m.content}`)));
+        return [...prev, ...fresh.filter(m => !seen.has(m.id) && !seen.has(`${m.role}|${m.content}`))];
+      });
+    } catch (e) {}
+  }, [sessionId]);
+
   // Initial greeting
   useEffect(() => {
     if (hasGreeted) return;